@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Comment, Follow, Group, Post
+from .models import Comment, Follow, Group, Post, Task
 
 
 class CommentAdmin(admin.ModelAdmin):
@@ -29,7 +29,16 @@ class PostAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
 
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'name', 'args', 'status', 'attempts', 'run_after',
+                    'last_error')
+    search_fields = ('name',)
+    list_filter = ('status', 'name')
+    empty_value_display = '-пусто-'
+
+
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Post, PostAdmin)
+admin.site.register(Task, TaskAdmin)
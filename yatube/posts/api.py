@@ -0,0 +1,220 @@
+"""
+JSON API только для чтения поверх тех же выборок, что и HTML-ленты.
+
+Страницы — по курсору: ?before=<курсор из next>, ?limit= до MAX_LIMIT.
+?fields=id,text,... оставляет в объектах только нужные поля.
+ETag и Last-Modified строятся из версий кеша (posts/cache.py), поэтому
+неизменившаяся страница отдается как 304 без запросов к базе.
+"""
+from functools import wraps
+
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import require_safe
+from django.views.decorators.vary import vary_on_cookie
+
+from posts.cache import conditional_feed
+from posts.models import Follow, Group, Post, User
+from posts.paginator import (CursorPaginator, decode_cursor, decode_id,
+                             encode_cursor, to_int)
+from posts.timeline import TimelinePaginator
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def date(value):
+    return value.isoformat() if value else None
+
+
+POST_FIELDS = {
+    'id': lambda post: post.pk,
+    'text': lambda post: post.text,
+    'pub_date': lambda post: date(post.pub_date),
+    'author': lambda post: post.author.username,
+    'group': lambda post: post.group.slug if post.group_id else None,
+    'image': lambda post: post.image.url if post.image else None,
+    'comments_count': lambda post: post.comments_count,
+}
+COMMENT_FIELDS = {
+    'id': lambda comment: comment.pk,
+    'post': lambda comment: comment.post_id,
+    'author': lambda comment: comment.author.username,
+    'text': lambda comment: comment.text,
+    'created': lambda comment: date(comment.created),
+}
+GROUP_FIELDS = {
+    'id': lambda group: group.pk,
+    'slug': lambda group: group.slug,
+    'title': lambda group: group.title,
+    'description': lambda group: group.description,
+}
+FOLLOW_FIELDS = {
+    'id': lambda follow: follow.pk,
+    'user': lambda follow: follow.user.username,
+    'author': lambda follow: follow.author.username,
+}
+
+
+class FieldsError(ValueError):
+    pass
+
+
+def error(message, status):
+    return JsonResponse({'detail': message}, status=status)
+
+
+def api_response(data, status=200):
+    """ Компактный JSON без экранирования кириллицы """
+    return JsonResponse(data, status=status, json_dumps_params={
+        'ensure_ascii': False, 'separators': (',', ':')})
+
+
+def selected_fields(request, fields):
+    """ Сериализаторы полей из ?fields=, по умолчанию все """
+    names = request.GET.get('fields')
+    if not names:
+        return fields
+    names = [name.strip() for name in names.split(',') if name.strip()]
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        raise FieldsError('Неизвестные поля: ' + ', '.join(unknown))
+    return {name: fields[name] for name in names}
+
+
+def serialize(obj, fields):
+    return {name: getter(obj) for name, getter in fields.items()}
+
+
+def next_url(request, cursor):
+    params = request.GET.copy()
+    params['before'] = cursor
+    return request.path + '?' + params.urlencode()
+
+
+def page(request, queryset, fields, date_field='pub_date', paginator=None):
+    """
+    Страница выборки по курсору: по (дата, id), как CursorPaginator
+    в HTML-лентах (или готовый paginator вместо queryset), или только
+    по id, если date_field=None
+    """
+    limit = min(to_int(request.GET.get('limit', DEFAULT_LIMIT), 1),
+                MAX_LIMIT)
+    before = request.GET.get('before')
+    if date_field is None:
+        objects = queryset.order_by('-pk')
+        before = decode_id(before)
+        if before is not None:
+            objects = objects.filter(pk__lt=before)
+    else:
+        paginator = paginator or CursorPaginator(queryset, limit,
+                                                 date_field=date_field)
+        objects = paginator.fetch(decode_cursor(before), False, 0, limit + 1)
+    objects = list(objects[:limit + 1])
+
+    cursor = None
+    if len(objects) > limit:
+        objects = objects[:limit]
+        last = objects[-1]
+        cursor = (str(last.pk) if date_field is None
+                  else encode_cursor(last, date_field))
+    return api_response({
+        'results': [serialize(obj, fields) for obj in objects],
+        'next': next_url(request, cursor) if cursor else None,
+    })
+
+
+def api_view(fields, scopes, per_user=False):
+    """
+    Общая обвязка ресурса: только GET/HEAD, разбор ?fields= и условные
+    запросы по версиям scopes. View получает выбранные поля первым
+    аргументом после request
+    """
+    def decorator(view):
+        @require_safe
+        @conditional_feed(scopes, per_user=per_user)
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            try:
+                selected = selected_fields(request, fields)
+            except FieldsError as exc:
+                return error(str(exc), 400)
+            try:
+                return view(request, selected, *args, **kwargs)
+            except Http404:
+                return error('Не найдено', 404)
+        return wrapper
+    return decorator
+
+
+def api_login_required(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return error('Требуется авторизация', 401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+@api_view(POST_FIELDS, lambda request: ['posts'])
+def posts(request, fields):
+    return page(request, Post.objects.feed(), fields)
+
+
+@api_view(POST_FIELDS, lambda request, post_id: ['posts'])
+def post_detail(request, fields, post_id):
+    post = get_object_or_404(Post.objects.feed(), pk=post_id)
+    return api_response(serialize(post, fields))
+
+
+@api_view(COMMENT_FIELDS, lambda request, post_id: ['posts'])
+def comments(request, fields, post_id):
+    post = get_object_or_404(Post, pk=post_id)
+    return page(request, post.comments.select_related('author'), fields,
+                date_field='created')
+
+
+@api_view(GROUP_FIELDS, lambda request: ['groups'])
+def groups(request, fields):
+    return page(request, Group.objects.all(), fields, date_field=None)
+
+
+@api_view(POST_FIELDS, lambda request, slug: [f'group:{slug}', 'groups'])
+def group_posts(request, fields, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return page(request, group.posts.feed(), fields)
+
+
+@api_view(POST_FIELDS,
+          lambda request, username: [f'author:{username}', 'groups'])
+def user_posts(request, fields, username):
+    author = get_object_or_404(User, username=username)
+    return page(request, author.posts.feed(), fields)
+
+
+@api_view(FOLLOW_FIELDS, lambda request, username: [f'author:{username}'])
+def following(request, fields, username):
+    user = get_object_or_404(User, username=username)
+    follows = Follow.objects.filter(user=user).select_related(
+        'user', 'author')
+    return page(request, follows, fields, date_field=None)
+
+
+@api_view(FOLLOW_FIELDS, lambda request, username: [f'author:{username}'])
+def followers(request, fields, username):
+    author = get_object_or_404(User, username=username)
+    follows = Follow.objects.filter(author=author).select_related(
+        'user', 'author')
+    return page(request, follows, fields, date_field=None)
+
+
+@api_login_required
+@vary_on_cookie
+@cache_control(private=True)
+@api_view(POST_FIELDS,
+          lambda request: ['posts', f'follower:{request.user.pk}'],
+          per_user=True)
+def follow_posts(request, fields):
+    return page(request, None, fields,
+                paginator=TimelinePaginator(request.user, DEFAULT_LIMIT))
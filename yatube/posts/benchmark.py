@@ -0,0 +1,222 @@
+"""
+Нагрузочный прогон основных страниц (manage.py benchmark).
+
+seed() наполняет базу правдоподобными данными: популярность авторов
+распределена по степенному закону (немногие «звезды» собирают
+большинство подписчиков, постов и комментариев). run() гоняет
+сценарии через тестовый клиент Django и для каждого считает
+перцентили времени ответа, число SQL-запросов и число последовательных
+запросов в секунду (один клиент, без параллельности).
+"""
+import math
+import random
+import subprocess
+import time
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.shortcuts import reverse
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from posts import dump
+from posts.models import Comment, Follow, Group, Post, User
+from posts.paginator import encode_cursor
+
+BATCH_SIZE = 500
+POST_INTERVAL = timedelta(minutes=7)
+
+
+def power_law_weights(count, alpha):
+    """ Вес i-го по популярности: 1 / i^alpha """
+    return [1 / (rank ** alpha) for rank in range(1, count + 1)]
+
+
+def seed(users=200, posts=2000, groups=10, comments=5000, follows=20,
+         alpha=1.2, rng=None):
+    """
+    Создает данные для прогона и возвращает словарь с их параметрами.
+    follows — сколько авторов в среднем читает пользователь
+    """
+    rng = rng or random.Random(0)
+    User.objects.bulk_create(
+        (User(username=f'bench{i}') for i in range(users)),
+        batch_size=BATCH_SIZE)
+    people = list(User.objects.filter(
+        username__startswith='bench').order_by('pk'))
+    weights = power_law_weights(len(people), alpha)
+    Group.objects.bulk_create(
+        (Group(title=f'Группа {i}', slug=f'bench-{i}',
+               description='Группа для нагрузочного прогона')
+         for i in range(groups)),
+        batch_size=BATCH_SIZE)
+    group_list = list(Group.objects.filter(slug__startswith='bench-'))
+
+    authors = rng.choices(people, weights, k=posts)
+    # у каждого поста своя дата в прошлом: с одинаковыми лента и курсоры
+    # по (pub_date, id) вели бы себя не как на живых данных
+    now = timezone.now()
+    with dump.keep_dates():
+        Post.objects.bulk_create(
+            (Post(author=author, text=f'Пост номер {i} про котиков и собак',
+                  group=rng.choice(group_list + [None]),
+                  pub_date=now - POST_INTERVAL * (posts - i))
+             for i, author in enumerate(authors)),
+            batch_size=BATCH_SIZE)
+    post_ids = list(Post.objects.filter(
+        author__in=people).order_by('pk').values_list('pk', flat=True))
+
+    # комментируют чаще посты популярных авторов: берем авторов по весу
+    weight_of = {user.pk: weight for user, weight in zip(people, weights)}
+    post_weights = [weight_of[author.pk] for author in authors]
+    commented = rng.choices(post_ids, post_weights, k=comments)
+    Comment.objects.bulk_create(
+        (Comment(post_id=post_id, author=rng.choice(people),
+                 text=f'Комментарий {i}')
+         for i, post_id in enumerate(commented)),
+        batch_size=BATCH_SIZE)
+
+    pairs = set()
+    for user in people:
+        wanted = min(max(1, round(rng.expovariate(1 / follows))),
+                     len(people) - 1)
+        for author in rng.choices(people, weights, k=wanted):
+            if author != user:
+                pairs.add((user.pk, author.pk))
+    Follow.objects.bulk_create(
+        (Follow(user_id=user_id, author_id=author_id)
+         for user_id, author_id in pairs),
+        batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+    # bulk_create не шлет сигналов: досчитываем то, что они ведут
+    dump.rebuild_derived()
+    return {'users': users, 'posts': posts, 'groups': groups,
+            'comments': comments, 'follows': len(pairs), 'alpha': alpha}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = max(math.ceil(fraction * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+def measure(client, method, path, data=None):
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = getattr(client, method)(path, data or {})
+        elapsed = time.perf_counter() - started
+    if response.status_code >= 400:
+        raise RuntimeError(f'{path}: HTTP {response.status_code}')
+    return elapsed, len(queries)
+
+
+def summarize(timings):
+    latencies = [elapsed * 1000 for elapsed, _ in timings]
+    queries = [count for _, count in timings]
+    total = sum(latencies) / 1000
+    # клиент один и шлет запросы по очереди, поэтому это 1 / среднее
+    # время ответа, а не пропускная способность сервера под нагрузкой
+    return {
+        'requests': len(timings),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'p50_ms': round(percentile(latencies, 0.5), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'max_ms': round(max(latencies), 2),
+        'serial_rps': round(len(timings) / total, 1) if total else None,
+        'queries_avg': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+def scenarios(rng):
+    """ Имя сценария -> функция client -> (метод, адрес, данные) """
+    people = list(User.objects.filter(
+        username__startswith='bench').select_related('counters'))
+    star = max(people, key=lambda user: user.counters.followers)
+    # ленту подписок читает тот, у кого больше всех подписок
+    reader = max(people, key=lambda user: user.counters.following)
+    groups = list(Group.objects.filter(
+        slug__startswith='bench-').values_list('slug', flat=True))
+    posts = list(Post.objects.filter(author__in=people).values_list(
+        'author__username', 'pk'))
+    index_cursor = deep_cursor()
+
+    return {
+        'index': lambda: ('get', reverse('index'), None),
+        'index_deep': lambda: ('get', reverse('index'),
+                               {'before': index_cursor}),
+        'group_posts': lambda: (
+            'get', reverse('group_posts', args=(rng.choice(groups),)), None),
+        'profile_star': lambda: (
+            'get', reverse('profile', args=(star.username,)), None),
+        'profile': lambda: (
+            'get', reverse('profile', args=(rng.choice(people).username,)),
+            None),
+        'post_detail': lambda: (
+            'get', reverse('post_view', args=rng.choice(posts)),
+            None),
+        'follow_index': lambda: ('get', reverse('follow_index'), None),
+        'add_comment': lambda: (
+            'post', reverse('add_comment', args=rng.choice(posts)),
+            {'text': 'Комментарий из прогона'}),
+    }, reader
+
+
+def deep_cursor():
+    """ Курсор на середину ленты: глубокая страница index """
+    count = Post.objects.count()
+    post = Post.objects.order_by('-pub_date', '-pk')[count // 2]
+    return encode_cursor(post)
+
+
+def run(requests=50, warmup=5, rng=None, only=None):
+    """ Прогоняет сценарии; возвращает {сценарий: сводка} """
+    rng = rng or random.Random(0)
+    all_scenarios, reader = scenarios(rng)
+    client = Client()
+    client.force_login(reader)
+    results = {}
+    for name, make_request in all_scenarios.items():
+        if only and name not in only:
+            continue
+        for _ in range(warmup):
+            measure(client, *make_request())
+        results[name] = summarize(
+            [measure(client, *make_request()) for _ in range(requests)])
+    return results
+
+
+def environment():
+    """ Что нужно знать, чтобы сравнивать прогоны между коммитами """
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, cwd=settings.BASE_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'date': timezone.now().isoformat(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'cache': settings.CACHES['default']['BACKEND'],
+    }
+
+
+def compare(previous, current):
+    """ Строки с изменением p95 и числа запросов к прошлому прогону """
+    lines = []
+    for name, result in current.items():
+        before = previous.get(name)
+        if before is None:
+            continue
+        change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms']
+        lines.append(
+            f'{name}: p95 {before["p95_ms"]} -> {result["p95_ms"]} ms '
+            f'({change:+.0%}), запросов {before["queries_avg"]} -> '
+            f'{result["queries_avg"]}')
+    return lines
@@ -0,0 +1,414 @@
+import hashlib
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_cache_control, patch_response_headers
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_cookie
+
+from posts.fragments import fill_response
+from posts.paginator import encode_cursor
+
+VERSION_KEY = 'feed_version:{}'
+MODIFIED_KEY = 'feed_modified:{}'
+PAGE_KEY = 'feed_page:{versions}:{user}:{path}'
+STALE_KEY = 'feed_stale:{user}:{path}'
+LOCK_KEY = 'feed_lock:{}'
+FRAGMENT_KEY = 'feed_fragment:{scope}:{version}:{cursor}'
+STATS_KEY = 'cache_stats:{name}:{event}'
+STATS_NAMES = ('page', 'fragment')
+
+# memcached: не длиннее 250 символов, без пробелов и управляющих символов
+MAX_KEY_LENGTH = 200
+UNSAFE_KEY_CHARS = re.compile(r'[^\x21-\x7e]')
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+# ключи, которые сейчас пересчитываются в этом процессе
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def make_key(key, key_prefix, version) -> str:
+    """
+    KEY_FUNCTION кеша: как у Django, но ключи с адресами страниц,
+    которые бывают длинными или с пробелами, заменяются хешем
+    """
+    if len(key) > MAX_KEY_LENGTH or UNSAFE_KEY_CHARS.search(key):
+        key = hashlib.md5(key.encode()).hexdigest()
+    return f'{key_prefix}:{version}:{key}'
+
+
+def record(name, hit):
+    """
+    Учитывает попадание или промах. Счетчики копятся в процессе
+    и пачкой прибавляются к общим в кеше
+    """
+    with _stats_lock:
+        _stats[(name, 'hit' if hit else 'miss')] += 1
+        if sum(_stats.values()) < settings.CACHE_STATS_FLUSH_EVERY:
+            return
+        pending = dict(_stats)
+        _stats.clear()
+    flush_stats(pending)
+
+
+def flush_stats(pending=None):
+    if pending is None:
+        with _stats_lock:
+            pending = dict(_stats)
+            _stats.clear()
+    for (name, event), count in pending.items():
+        key = STATS_KEY.format(name=name, event=event)
+        if cache.add(key, count, None):
+            continue
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            cache.set(key, count, None)
+
+
+def read_stats() -> dict:
+    """ {имя: (попадания, промахи)} по всем процессам """
+    keys = {(name, event): STATS_KEY.format(name=name, event=event)
+            for name in STATS_NAMES for event in ('hit', 'miss')}
+    values = cache.get_many(keys.values())
+    return {name: (values.get(keys[(name, 'hit')], 0),
+                   values.get(keys[(name, 'miss')], 0))
+            for name in STATS_NAMES}
+
+
+def reset_stats():
+    cache.delete_many([STATS_KEY.format(name=name, event=event)
+                       for name in STATS_NAMES for event in ('hit', 'miss')])
+
+
+def new_version() -> int:
+    """
+    Начальная версия — текущее время, а не 1: если ключ версии вытеснят
+    из кеша, старые страницы со старыми версиями уже не всплывут
+    """
+    return time.time_ns()
+
+
+def get_versions(scopes) -> list:
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def last_modified(scopes):
+    """
+    Время последнего изменения scopes (для Last-Modified). Если оно
+    неизвестно, считаем, что изменения были только что
+    """
+    keys = [MODIFIED_KEY.format(scope) for scope in scopes]
+    modified = cache.get_many(keys)
+    missing = {key: time.time() for key in keys if key not in modified}
+    if missing:
+        cache.set_many(missing, None)
+        modified.update(missing)
+    return datetime.fromtimestamp(max(modified.values()), timezone.utc)
+
+
+def bump(*scopes):
+    """
+    Инвалидирует все закешированные страницы, зависящие от scopes.
+    Версии меняются после коммита: иначе запрос, пришедший между
+    сбросом и коммитом, закеширует старые строки под новой версией
+    """
+    scopes = list(scopes)
+    transaction.on_commit(lambda: bump_now(scopes))
+
+
+def bump_now(scopes):
+    # новая версия записывается, а не прибавляется: incr и add
+    # атомарны только в memcached, а в файловом кеше это чтение
+    # и запись, и два процесса могли бы получить одну версию
+    version = new_version()
+    cache.set_many({VERSION_KEY.format(scope): version for scope in scopes},
+                   None)
+    now = time.time()
+    cache.set_many({MODIFIED_KEY.format(scope): now for scope in scopes},
+                   None)
+
+
+def feed_cache_key(request, scopes, per_user=False) -> str:
+    versions = '.'.join(str(version) for version in get_versions(scopes))
+    user = request.user.pk if per_user else 'all'
+    return PAGE_KEY.format(versions=versions, user=user,
+                           path=request.get_full_path())
+
+
+def stale_cache_key(request, per_user=False) -> str:
+    """ Последняя отрендеренная версия страницы, без версий scopes """
+    user = request.user.pk if per_user else 'all'
+    return STALE_KEY.format(user=user, path=request.get_full_path())
+
+
+def expiring(delta, expires, beta=None) -> bool:
+    """
+    Вероятностный досрочный пересчет (XFetch): чем ближе срок и чем
+    дольше значение считалось (delta), тем вероятнее, что этот запрос
+    пересчитает его заранее, пока остальные еще получают старое
+    """
+    if beta is None:
+        beta = settings.CACHE_EARLY_RECOMPUTE_BETA
+    return time.time() - delta * beta * math.log(random.random()) >= expires
+
+
+@contextmanager
+def local_flight(key, wait):
+    """
+    Один пересчет ключа на процесс: поток, который не первым взялся
+    за ключ, получает False (или, если wait, ждет первого и тоже
+    получает False)
+    """
+    with _flights_lock:
+        lock = _flights.setdefault(key, threading.Lock())
+    acquired = lock.acquire(blocking=False)
+    if not acquired and wait:
+        if lock.acquire(timeout=settings.FEED_CACHE_LOCK_WAIT):
+            lock.release()
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with _flights_lock:
+                _flights.pop(key, None)
+            lock.release()
+
+
+def single_flight(key, compute, timeout, fallback=None, stale_key=None,
+                  cacheable=None):
+    """
+    Считает значение key один раз на все потоки процесса (под
+    threading.Lock ключа) и, как правило, один раз на все процессы
+    (под блокировкой cache.add: атомарной в memcached, а в файловом
+    кеше — лишь сужающей окно гонки). Остальные получают fallback,
+    а если его нет — ждут готовое значение до FEED_CACHE_LOCK_WAIT
+    секунд.
+
+    Возвращает (значение, отдан ли fallback)
+    """
+    with local_flight(key, wait=fallback is None) as leader:
+        if not leader:
+            if fallback is not None:
+                return fallback, True
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[0], False
+        lock = LOCK_KEY.format(key)
+        if not cache.add(lock, 1, settings.FEED_CACHE_LOCK_TIMEOUT):
+            if fallback is not None:
+                return fallback, True
+            deadline = time.monotonic() + settings.FEED_CACHE_LOCK_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                entry = cache.get(key)
+                if entry is not None:
+                    return entry[0], False
+        try:
+            started = time.time()
+            value = compute()
+            if cacheable is None or cacheable(value):
+                delta = time.time() - started
+                values = {key: (value, delta, time.time() + timeout)}
+                if stale_key is not None:
+                    values[stale_key] = value
+                cache.set_many(values, timeout)
+        finally:
+            cache.delete(lock)
+        return value, False
+
+
+def cached(key, compute, timeout, stale_key=None, cacheable=None,
+           name=None):
+    """
+    cache.get_or_set с защитой от «толпы» для страниц и выборок:
+    при промахе и при досрочном пересчете (expiring) считает один
+    запрос (single_flight), остальные получают прежнее значение —
+    еще не истекшее или последнее сохраненное под stale_key.
+
+    :param cacheable: функция значение -> bool, что можно класть в кеш
+    :param name: имя для счетчиков попаданий (manage.py cache_stats)
+    :return: (значение, свежее ли оно)
+    """
+    entry = cache.get(key)
+    if name is not None:
+        record(name, entry is not None)
+    if entry is not None:
+        value, delta, expires = entry
+        if not expiring(delta, expires):
+            return value, True
+        fallback = value
+    else:
+        fallback = cache.get(stale_key) if stale_key is not None else None
+    value, used_fallback = single_flight(
+        key, compute, timeout, fallback=fallback, stale_key=stale_key,
+        cacheable=cacheable)
+    # досрочно пересчитываемое значение еще не истекло, а stale — устарело
+    return value, not (used_fallback and entry is None)
+
+
+def feed_etag(request, scopes, per_user=False) -> str:
+    """
+    ETag страницы из версий scopes: считается без запросов к базе.
+    В ETag вошедшего пользователя входит и секрет CSRF: после нового
+    входа он другой, и страница с формой и старым токеном не вернется
+    из кеша браузера ответом 304
+    """
+    versions = '.'.join(str(version) for version in get_versions(scopes))
+    user = ''
+    if per_user and request.user.is_authenticated:
+        user = f"{request.user.pk}|{request.META.get('CSRF_COOKIE', '')}"
+    raw = f'{versions}|{user}|{request.get_full_path()}'
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def conditional_feed(scopes, per_user=False):
+    """
+    Условные GET для страниц, зависящих от scopes: ETag и Last-Modified
+    берутся из версий в кеше, и 304 отдается до вызова view.
+    Заголовки остаются только у успешных и не устаревших ответов
+
+    :param scopes: функция (request, *args, **kwargs) -> список областей
+    :param per_user: ответ зависит от пользователя
+    """
+    def etag(request, *args, **kwargs):
+        return feed_etag(request, scopes(request, *args, **kwargs),
+                         per_user=per_user)
+
+    def modified(request, *args, **kwargs):
+        return last_modified(scopes(request, *args, **kwargs))
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag,
+                                     last_modified_func=modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if (response.status_code not in (200, 304)
+                    or getattr(response, 'is_stale', False)):
+                for header in ('ETag', 'Last-Modified'):
+                    if response.has_header(header):
+                        del response[header]
+            return response
+        return wrapper
+    return decorator
+
+
+def revalidate_page(scopes):
+    """
+    HTML-страница, которую браузер и прокси перепроверяют запросом
+    с If-None-Match / If-Modified-Since. Разметка зависит от
+    пользователя, поэтому ETag свой у каждого, ответ с Vary: Cookie,
+    а страницы вошедших пользователей помечены private
+
+    :param scopes: функция (request, *args, **kwargs) -> список областей
+    """
+    def decorator(view):
+        conditional_view = vary_on_cookie(
+            conditional_feed(scopes, per_user=True)(view))
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if (request.method in ('GET', 'HEAD')
+                    and response.status_code in (200, 304)):
+                patch_response_headers(response, cache_timeout=0)
+                if request.user.is_authenticated:
+                    patch_cache_control(response, private=True)
+                else:
+                    patch_cache_control(response, public=True)
+            return response
+        return wrapper
+    return decorator
+
+
+def fragment_cache_key(scope, page) -> str:
+    """
+    Ключ фрагмента ленты: scope, его версия и положение страницы (номер
+    и курсоры первого и последнего поста). Кусочки для пользователя
+    во фрагменте — метки (posts/fragments.py), поэтому он общий для всех
+    """
+    posts = list(page)
+    if posts:
+        cursor = '{}:{}:{}'.format(page.number, encode_cursor(posts[0]),
+                                   encode_cursor(posts[-1]))
+    else:
+        cursor = 'empty'
+    # названия групп есть в каждой карточке, поэтому учитываем и их версию
+    version = '.'.join(str(v) for v in get_versions([scope, 'groups']))
+    return FRAGMENT_KEY.format(scope=scope, version=version, cursor=cursor)
+
+
+def cacheable_response(response) -> bool:
+    if response.status_code != 200:
+        return False
+    # браузер должен переспрашивать: свежесть держит сервер
+    patch_response_headers(response, cache_timeout=0)
+    return True
+
+
+def render_skeleton(view, request, *args, **kwargs):
+    request.page_skeleton = True
+    try:
+        return view(request, *args, **kwargs)
+    finally:
+        request.page_skeleton = False
+
+
+def cache_feed(scopes, timeout=None, per_user=False):
+    """
+    Замена cache_page для лент: ключ страницы содержит версии scopes,
+    которые сигналы увеличивают при изменении постов, комментариев
+    и групп. Поэтому страницы можно держать в кеше долго, а новые посты
+    появляются сразу.
+
+    В кеше лежит скелет страницы, общий для всех пользователей
+    (см. posts/fragments.py), кусочки для пользователя вставляются
+    в него при каждом ответе.
+
+    :param scopes: функция (request, *args, **kwargs) -> список областей
+    :param per_user: сама выборка зависит от пользователя (/follow/)
+    """
+    if timeout is None:
+        timeout = settings.FEED_CACHE_TIMEOUT
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            key = feed_cache_key(request, scopes(request, *args, **kwargs),
+                                 per_user=per_user)
+            response, fresh = cached(
+                key,
+                lambda: render_skeleton(view, request, *args, **kwargs),
+                timeout,
+                stale_key=stale_cache_key(request, per_user),
+                cacheable=cacheable_response,
+                name='page',
+            )
+            if not fresh:
+                # валидаторы текущей версии к старой странице не подходят
+                response.is_stale = True
+            return fill_response(response, request)
+        return wrapper
+    return decorator
@@ -0,0 +1,87 @@
+"""
+Денормализованные счетчики: подписчики, подписки и посты пользователя
+(UserCounters) и комментарии поста (Post.comments_count).
+
+Сигналы при создании и удалении Follow, Post и Comment ставят фоновую
+задачу (posts/tasks.py), которая пересчитывает одно поле одной строки
+запросом UPDATE ... SET x = (SELECT COUNT(*) ...) по индексу. Задачу
+можно повторить или выполнить дважды и не по порядку: результат тот
+же, в отличие от приращений x = x + 1. Все счетчики разом пересчитывает
+manage.py recount_counters.
+"""
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from posts.cache import bump
+from posts.models import Comment, Follow, Post, User, UserCounters
+from posts.tasks import task
+
+# поле UserCounters -> (модель, ее поле со ссылкой на пользователя)
+COUNTED = {
+    'followers': (Follow, 'author'),
+    'following': (Follow, 'user'),
+    'posts': (Post, 'author'),
+}
+
+
+@task
+def refresh(user_id, field):
+    """ Пересчитывает поле field счетчиков пользователя """
+    model, related = COUNTED[field]
+    updated = UserCounters.objects.filter(user_id=user_id).update(
+        **{field: count_of(model, related)})
+    if not updated:
+        # строки нет: пользователя удаляют (каскад уже снес счетчики)
+        # или их не завели; новые заводит create_counters,
+        # старые чинит manage.py recount_counters
+        return
+    username = User.objects.filter(pk=user_id).values_list(
+        'username', flat=True).first()
+    if username is not None:
+        bump(f'author:{username}')
+
+
+@task
+def refresh_comments(post_id):
+    """ Пересчитывает число комментариев поста """
+    from posts.signals import post_scopes
+
+    post = Post.objects.filter(pk=post_id).select_related(
+        'author', 'group').first()
+    if post is None:
+        return
+    Post.objects.filter(pk=post_id).update(
+        comments_count=count_of(Comment, 'post'))
+    bump(*post_scopes(post))
+
+
+def count_of(model, field):
+    """ Подзапрос COUNT(*) по связанной модели для UPDATE """
+    counted = model.objects.filter(**{field: OuterRef('pk')}).order_by(
+    ).values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def recount(users=None):
+    """ Пересчитывает счетчики с нуля; users — queryset пользователей """
+    if users is None:
+        users = User.objects.all()
+    user_ids = users.values_list('pk', flat=True)
+    existing = UserCounters.objects.filter(
+        user_id__in=user_ids).values_list('user_id', flat=True)
+    UserCounters.objects.bulk_create(
+        (UserCounters(user_id=user_id)
+         for user_id in user_ids.exclude(pk__in=existing)),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    counters = UserCounters.objects.filter(user_id__in=user_ids)
+    counters.update(**{field: count_of(model, related)
+                       for field, (model, related) in COUNTED.items()})
+    return counters.count()
+
+
+def recount_comments(posts=None):
+    if posts is None:
+        posts = Post.objects.all()
+    return posts.update(comments_count=count_of(Comment, 'post'))
@@ -0,0 +1,160 @@
+"""
+Потоковая выгрузка и загрузка данных в NDJSON
+(manage.py export_ndjson / import_ndjson).
+
+Одна строка — один объект в формате сериализатора Django
+{"model": "posts.post", "pk": 1, "fields": {...}}, внешние ключи — id.
+Выгрузка читает таблицы iterator() кусками, загрузка копит объекты
+пачками и пишет каждую bulk_create в своей транзакции, поэтому
+память не зависит от объема данных. Производные данные (счетчики,
+ленты подписок, поисковый индекс) пересчитываются после загрузки.
+"""
+import gzip
+import json
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+from posts import counters, search, timeline
+from posts.models import Comment, Follow, Group, Post, User
+
+# порядок важен: объекты ссылаются только на выгруженные раньше
+MODELS = {
+    'auth.user': (User, ['password', 'last_login', 'is_superuser',
+                         'username', 'first_name', 'last_name', 'email',
+                         'is_staff', 'is_active', 'date_joined']),
+    'posts.group': (Group, ['title', 'slug', 'description']),
+    'posts.post': (Post, ['text', 'pub_date', 'author', 'group', 'image']),
+    'posts.comment': (Comment, ['post', 'author', 'text', 'created']),
+    'posts.follow': (Follow, ['user', 'author']),
+}
+CHUNK_SIZE = 2000
+
+
+class Encoder(DjangoJSONEncoder):
+    """
+    Даты с микросекундами: DjangoJSONEncoder режет их до миллисекунд,
+    а курсорная пагинация различает посты по точной дате
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def open_stream(path, mode):
+    """ Текстовый поток файла; .gz сжимается на лету """
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def export(stream, labels=None, progress=None):
+    """ Пишет объекты в stream по строке; возвращает {модель: число} """
+    totals = {}
+    for label, (model, fields) in MODELS.items():
+        if labels and label not in labels:
+            continue
+        rows = model.objects.order_by('pk').values_list('pk', *fields)
+        count = 0
+        for row in rows.iterator(chunk_size=CHUNK_SIZE):
+            record = {'model': label, 'pk': row[0],
+                      'fields': dict(zip(fields, row[1:]))}
+            stream.write(json.dumps(record, cls=Encoder,
+                                    ensure_ascii=False) + '\n')
+            count += 1
+            if progress and count % CHUNK_SIZE == 0:
+                progress(label, count)
+        totals[label] = count
+        if progress:
+            progress(label, count)
+    return totals
+
+
+@contextmanager
+def keep_dates():
+    """
+    bulk_create проставляет поля auto_now_add текущим временем:
+    на время загрузки даты берутся из файла
+    """
+    fields = [Post._meta.get_field('pub_date'),
+              Comment._meta.get_field('created')]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def build(label, pk, values):
+    model, fields = MODELS[label]
+    attrs = {}
+    for name in fields:
+        if name not in values:
+            continue
+        field = model._meta.get_field(name)
+        value = values[name]
+        if field.is_relation:
+            attrs[field.attname] = value
+        else:
+            attrs[name] = field.to_python(value)
+    return model(pk=pk, **attrs)
+
+
+def flush(label, batch, ignore_conflicts):
+    model = MODELS[label][0]
+    with transaction.atomic():
+        model.objects.bulk_create(batch, ignore_conflicts=ignore_conflicts)
+
+
+def reset_sequences(labels):
+    """ После вставки с явными id счетчики id в PostgreSQL отстают """
+    models = [MODELS[label][0] for label in labels]
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def load(stream, batch_size=5000, ignore_conflicts=False, progress=None):
+    """ Загружает объекты из stream пачками; возвращает {модель: число} """
+    totals = {}
+    label, batch = None, []
+    with keep_dates():
+        for line in stream:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record['model'] not in MODELS:
+                raise ValueError(f'Неизвестная модель {record["model"]}')
+            if batch and (record['model'] != label
+                          or len(batch) >= batch_size):
+                flush(label, batch, ignore_conflicts)
+                totals[label] = totals.get(label, 0) + len(batch)
+                if progress:
+                    progress(label, totals[label])
+                batch = []
+            label = record['model']
+            batch.append(build(label, record['pk'], record['fields']))
+        if batch:
+            flush(label, batch, ignore_conflicts)
+            totals[label] = totals.get(label, 0) + len(batch)
+            if progress:
+                progress(label, totals[label])
+    reset_sequences(totals)
+    return totals
+
+
+def rebuild_derived(follows=True):
+    """ Счетчики, ленты подписок и поиск: bulk_create не шлет сигналов """
+    counters.recount()
+    counters.recount_comments()
+    if follows:
+        timeline.rebuild()
+    search.rebuild()
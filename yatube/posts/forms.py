@@ -1,12 +1,37 @@
-from django.forms import ModelForm, Textarea
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.forms import ImageField, ModelForm, Textarea
 
 from posts.models import Comment, Post
+from posts.uploads import process_image
+
+
+class PostImageField(ImageField):
+    """
+    ImageField, который понимает отметки ImageUploadHandler о превышенных
+    лимитах и отдает на сохранение уменьшенную картинку без метаданных
+    """
+
+    def to_python(self, data):
+        error = getattr(data, 'upload_error', None)
+        if error:
+            raise ValidationError(error, code='too_large')
+        return super().to_python(data)
+
+    def clean(self, data, initial=None):
+        data = super().clean(data, initial)
+        if isinstance(data, UploadedFile):
+            return process_image(data)
+        return data
 
 
 class PostForm(ModelForm):
     class Meta:
         model = Post
         fields = ('group', 'text', 'image')
+        field_classes = {
+            'image': PostImageField,
+        }
         labels = {
             'group': 'Тематическая группа',
             'text': 'Ваша заметка',
@@ -0,0 +1,73 @@
+"""
+Кеш страниц с «дырками» под кусочки, зависящие от пользователя.
+
+Страница в кеше — общий для всех «скелет»: вместо имени в шапке,
+ссылок «Редактировать», кнопки подписки и формы комментария в нем
+стоят метки {% user_fragment %}. При каждом ответе метки заменяются
+маленькими шаблонами из FRAGMENTS, отрендеренными для текущего
+пользователя, так что кеш работает и для вошедших пользователей.
+"""
+import re
+from urllib.parse import parse_qsl, urlencode
+
+from django.template.loader import render_to_string
+
+from posts.forms import CommentForm
+from posts.models import Follow
+
+MARKER = '<!--user-fragment:{name}:{args}-->'
+MARKER_RE = re.compile(r'<!--user-fragment:(\w+):([^>]*)-->')
+
+
+def follow_context(request, author_id, **kwargs):
+    followed = Follow.objects.followed_ids(request.user, [int(author_id)])
+    return {'is_follow': bool(followed)}
+
+
+def comment_form_context(request, **kwargs):
+    return {'form': CommentForm()}
+
+
+# имя -> (шаблон, функция дополнительного контекста)
+FRAGMENTS = {
+    'nav': ('fragments/nav.html', None),
+    'menu': ('fragments/menu.html', None),
+    'post_edit': ('fragments/post_edit.html', None),
+    'follow_button': ('fragments/follow_button.html', follow_context),
+    'comment_form': ('fragments/comment_form.html', comment_form_context),
+}
+
+
+def marker(name, args) -> str:
+    return MARKER.format(name=name, args=urlencode(args))
+
+
+def render_fragment(name, args, request) -> str:
+    template_name, extra_context = FRAGMENTS[name]
+    context = dict(args)
+    if extra_context is not None:
+        context.update(extra_context(request, **args))
+    return render_to_string(template_name, context, request=request)
+
+
+def fill(content, request) -> str:
+    """ Заменяет метки в скелете кусочками для пользователя запроса """
+    return MARKER_RE.sub(
+        lambda match: render_fragment(
+            match[1], dict(parse_qsl(match[2])), request),
+        content)
+
+
+def fill_response(response, request):
+    if response.streaming or b'<!--user-fragment:' not in response.content:
+        return response
+    response.content = fill(response.content.decode(response.charset),
+                            request)
+    return response
+
+
+def is_skeleton(context) -> bool:
+    """ Рендерится общий скелет: вместо кусочков надо ставить метки """
+    request = context.get('request')
+    return bool(context.get('page_skeleton')
+                or getattr(request, 'page_skeleton', False))
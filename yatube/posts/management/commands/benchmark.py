@@ -0,0 +1,102 @@
+import json
+import random
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+
+from posts import benchmark
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'KEY_FUNCTION': 'posts.cache.make_key',
+    }
+}
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон страниц на отдельной временной базе '
+            'с правдоподобными данными; результаты пишутся в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--posts', type=int, default=2000)
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--comments', type=int, default=5000)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='сколько авторов в среднем читает '
+                                 'пользователь')
+        parser.add_argument('--alpha', type=float, default=1.2,
+                            help='показатель степенного закона '
+                                 'популярности авторов')
+        parser.add_argument('--requests', type=int, default=50,
+                            help='запросов на сценарий')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--scenario', action='append', dest='only',
+                            help='прогнать только эти сценарии')
+        parser.add_argument('--cache', choices=['settings', 'locmem'],
+                            default='settings',
+                            help='бэкенд кеша из настроек или '
+                                 'LocMemCache; ключи всегда свои')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--compare',
+                            help='JSON прошлого прогона для сравнения')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # страницы временной базы и сброс версий не должны попасть в кеш
+        # сайта, даже общий с ним: свой префикс ключей на каждый прогон
+        caches = (LOCMEM_CACHES if options['cache'] == 'locmem'
+                  else settings.CACHES)
+        prefix = f'yatube-bench-{uuid.uuid4().hex[:8]}'
+        overrides = {
+            'DEBUG': False,
+            'TASK_QUEUE': 'sync',
+            'CACHES': {alias: {**config, 'KEY_PREFIX': prefix}
+                       for alias, config in caches.items()},
+        }
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+        try:
+            with override_settings(**overrides):
+                self.stdout.write('Наполняю базу...')
+                dataset = benchmark.seed(
+                    users=options['users'], posts=options['posts'],
+                    groups=options['groups'], comments=options['comments'],
+                    follows=options['follows'], alpha=options['alpha'],
+                    rng=rng)
+                results = benchmark.run(
+                    requests=options['requests'], warmup=options['warmup'],
+                    rng=rng, only=options['only'])
+                report = {
+                    'environment': benchmark.environment(),
+                    'dataset': dataset,
+                    'results': results,
+                }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name}: p50 {result["p50_ms"]} ms, '
+                f'p95 {result["p95_ms"]} ms, '
+                f'{result["serial_rps"]} rps в один поток, '
+                f'запросов {result["queries_avg"]}')
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as previous:
+                lines = benchmark.compare(
+                    json.load(previous)['results'], results)
+            for line in lines:
+                self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты записаны в {options["output"]}'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts import cache
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания и промахи кеша страниц и фрагментов лент'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='обнулить счетчики после вывода')
+
+    def handle(self, *args, **options):
+        for name, (hits, misses) in cache.read_stats().items():
+            total = hits + misses
+            rate = f'{hits / total:.1%}' if total else '—'
+            self.stdout.write(
+                f'{name}: попаданий {hits}, промахов {misses}, доля {rate}')
+        if options['reset']:
+            cache.reset_stats()
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.query_plans import check_feed_plans
+
+
+class Command(BaseCommand):
+    help = ('Проверяет, что запросы лент идут по индексам, '
+            'а не полным сканированием таблиц')
+
+    def handle(self, *args, **options):
+        problems = check_feed_plans()
+        if problems:
+            report = '\n'.join(
+                f'{name}: {line}'
+                for name, lines in problems.items() for line in lines)
+            raise CommandError(f'Запросы без индекса:\n{report}')
+        self.stdout.write(self.style.SUCCESS('Планы запросов в порядке'))
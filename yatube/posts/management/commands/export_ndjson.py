@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from posts import dump
+
+
+class Command(BaseCommand):
+    help = ('Потоково выгружает пользователей, группы, посты, комментарии '
+            'и подписки в NDJSON (по объекту в строке)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-',
+                            help='файл (.gz — со сжатием), по умолчанию '
+                                 'stdout')
+        parser.add_argument('--model', action='append', dest='models',
+                            choices=list(dump.MODELS),
+                            help='выгрузить только эти модели')
+
+    def progress(self, label, count):
+        self.stderr.write(f'{label}: {count}')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if path == '-':
+            totals = dump.export(sys.stdout, options['models'],
+                                 self.progress)
+        else:
+            with dump.open_stream(path, 'w') as stream:
+                totals = dump.export(stream, options['models'],
+                                     self.progress)
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено объектов: {sum(totals.values())}'))
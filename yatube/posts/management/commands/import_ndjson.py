@@ -0,0 +1,44 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from posts import dump
+
+
+class Command(BaseCommand):
+    help = ('Загружает NDJSON из export_ndjson пачками bulk_create, '
+            'по транзакции на пачку, затем пересчитывает счетчики, '
+            'ленты подписок и поисковый индекс')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-',
+                            help='файл (.gz — со сжатием), по умолчанию '
+                                 'stdin')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--ignore-conflicts', action='store_true',
+                            help='пропускать объекты, которые уже есть '
+                                 'в базе')
+        parser.add_argument('--skip-derived', action='store_true',
+                            help='не пересчитывать производные данные '
+                                 '(потом recount_counters, '
+                                 'rebuild_timelines и '
+                                 'rebuild_search_index)')
+
+    def progress(self, label, count):
+        self.stderr.write(f'{label}: {count}')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        kwargs = {'batch_size': options['batch_size'],
+                  'ignore_conflicts': options['ignore_conflicts'],
+                  'progress': self.progress}
+        if path == '-':
+            totals = dump.load(sys.stdin, **kwargs)
+        else:
+            with dump.open_stream(path, 'r') as stream:
+                totals = dump.load(stream, **kwargs)
+        if not options['skip_derived']:
+            self.stderr.write('Пересчитываю производные данные...')
+            dump.rebuild_derived(follows='posts.follow' in totals)
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено объектов: {sum(totals.values())}'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = ('Собирает материализованные ленты подписок (TimelineEntry) '
+            'заново по подпискам и постам')
+
+    def handle(self, *args, **options):
+        total = timeline.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей в лентах: {total}'))
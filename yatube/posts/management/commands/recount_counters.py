@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает денормализованные счетчики подписчиков, '
+            'подписок, постов и комментариев')
+
+    def handle(self, *args, **options):
+        users = counters.recount()
+        posts = counters.recount_comments()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано: пользователей {users}, постов {posts}'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from posts import tasks
+
+
+class Command(BaseCommand):
+    help = ('Воркер очереди фоновых задач (TASK_QUEUE = "db"): забирает '
+            'созревшие задачи из таблицы и выполняет их в пуле потоков')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='потоков, по умолчанию TASK_WORKERS; '
+                                 '0 — в основном потоке')
+        parser.add_argument('--batch', type=int, default=None,
+                            help='сколько задач забирать за раз')
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='пауза в секундах, когда очередь пуста')
+        parser.add_argument('--once', action='store_true',
+                            help='выйти, когда очередь опустеет')
+
+    def handle(self, *args, **options):
+        try:
+            done, failed = tasks.work(
+                workers=options['workers'], batch=options['batch'],
+                once=options['once'], poll=options['poll'])
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Выполнено задач: {done}, с ошибкой: {failed}'))
@@ -0,0 +1,197 @@
+"""
+Легкие метрики запросов для продакшена (в отличие от debug_toolbar).
+
+RequestMetricsMiddleware (posts/middleware.py) для каждого запроса
+считает число SQL-запросов и время в базе (connection.execute_wrapper),
+время рендера шаблонов и общее время ответа. Значения копятся
+в гистограммах по имени view в памяти процесса: их показывает
+/internal/metrics/ и раз в REQUEST_METRICS_LOG_EVERY запросов пишет
+в лог строка-сводка. Запросы сверх QUERY_BUDGET попадают в лог сразу.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.template.backends.django import Template
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BOUNDS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BOUNDS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+# сборщик текущего запроса; ContextVar, чтобы потоки не мешали друг другу
+current = ContextVar('request_metrics', default=None)
+
+
+class Histogram:
+    """ Гистограмма с фиксированными границами корзин """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def percentile(self, fraction):
+        """ Верхняя граница корзины, в которую попал перцентиль """
+        if not self.count:
+            return 0
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def as_dict(self):
+        labels = [f'<={bound}' for bound in self.bounds] + ['inf']
+        return {
+            'count': self.count,
+            'avg': round(self.total / self.count, 2) if self.count else 0,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'buckets': dict(zip(labels, self.buckets)),
+        }
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.over_budget = 0
+        self.latency = Histogram(LATENCY_BOUNDS)
+        self.db_time = Histogram(LATENCY_BOUNDS)
+        self.template_time = Histogram(LATENCY_BOUNDS)
+        self.queries = Histogram(QUERY_BOUNDS)
+
+    def as_dict(self):
+        return {
+            'requests': self.latency.count,
+            'over_budget': self.over_budget,
+            'latency_ms': self.latency.as_dict(),
+            'db_ms': self.db_time.as_dict(),
+            'template_ms': self.template_time.as_dict(),
+            'queries': self.queries.as_dict(),
+        }
+
+
+class RequestMetrics:
+    """ Сборщик одного запроса, он же execute_wrapper для базы """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0
+        self.template_time = 0
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+    @property
+    def latency(self):
+        return time.perf_counter() - self.started
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.requests = 0
+
+    def record(self, view, metrics, over_budget):
+        with self.lock:
+            stats = self.views.setdefault(view, ViewMetrics())
+            stats.latency.observe(metrics.latency * 1000)
+            stats.db_time.observe(metrics.db_time * 1000)
+            stats.template_time.observe(metrics.template_time * 1000)
+            stats.queries.observe(metrics.queries)
+            stats.over_budget += over_budget
+            self.requests += 1
+            every = settings.REQUEST_METRICS_LOG_EVERY
+            if every and self.requests % every == 0:
+                logger.info('request metrics %s', json.dumps(
+                    self.summary(), ensure_ascii=False))
+
+    def summary(self):
+        """ Коротко по каждому view: для строки в логе """
+        return {
+            view: {
+                'n': stats.latency.count,
+                'p95_ms': stats.latency.percentile(0.95),
+                'avg_queries': stats.queries.as_dict()['avg'],
+                'over_budget': stats.over_budget,
+            }
+            for view, stats in self.views.items()
+        }
+
+    def snapshot(self):
+        with self.lock:
+            return {view: stats.as_dict()
+                    for view, stats in sorted(self.views.items())}
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+            self.requests = 0
+
+
+registry = Registry()
+
+
+def query_budget(view):
+    return settings.QUERY_BUDGETS.get(view, settings.QUERY_BUDGET)
+
+
+_original_render = Template.render
+
+
+def timed_render(self, context=None, request=None):
+    """
+    Template.render бэкенда Django с замером времени. Вложенные рендеры
+    (кусочки внутри страницы) не считаются второй раз
+    """
+    metrics = current.get()
+    if metrics is None:
+        return _original_render(self, context, request)
+    metrics.template_depth += 1
+    started = time.perf_counter()
+    try:
+        return _original_render(self, context, request)
+    finally:
+        metrics.template_depth -= 1
+        if not metrics.template_depth:
+            metrics.template_time += time.perf_counter() - started
+
+
+def instrument_templates():
+    Template.render = timed_render
+
+
+def metrics_view(request):
+    """
+    Гистограммы этого процесса; только для персонала. INTERNAL_IPS
+    не подходит: за прокси REMOTE_ADDR у всех запросов адрес прокси
+    """
+    if not request.user.is_staff:
+        raise Http404
+    return JsonResponse({'pid': os.getpid(), 'views': registry.snapshot()},
+                        json_dumps_params={'ensure_ascii': False})
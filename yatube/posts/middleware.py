@@ -0,0 +1,54 @@
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from posts import metrics
+
+logger = logging.getLogger('posts.metrics')
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unresolved'
+
+
+class RequestMetricsMiddleware:
+    """
+    Считает SQL-запросы, время в базе и в шаблонах и общее время
+    ответа каждого запроса (см. posts/metrics.py). Должен стоять первым
+    в MIDDLEWARE, чтобы время ответа включало остальные middleware
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        metrics.instrument_templates()
+
+    def __call__(self, request):
+        collector = metrics.RequestMetrics()
+        token = metrics.current.set(collector)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(collector))
+                response = self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+
+        view = view_name(request)
+        budget = metrics.query_budget(view)
+        over_budget = collector.queries > budget
+        if over_budget:
+            logger.warning('%s: %d SQL-запросов при бюджете %d (%s)',
+                           view, collector.queries, budget,
+                           request.get_full_path())
+        metrics.registry.record(view, collector, over_budget)
+        if settings.REQUEST_METRICS_SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'db;dur={collector.db_time * 1000:.1f};'
+                f'desc="{collector.queries} queries", '
+                f'tpl;dur={collector.template_time * 1000:.1f}, '
+                f'total;dur={collector.latency * 1000:.1f}')
+        return response
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.9 on 2026-10-18 19:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_rendition'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='rendition',
+            name='unique_rendition',
+        ),
+        migrations.AddField(
+            model_name='rendition',
+            name='format',
+            field=models.CharField(default='original', max_length=10),
+        ),
+        migrations.AddConstraint(
+            model_name='rendition',
+            constraint=models.UniqueConstraint(fields=('post', 'name', 'format', 'width'), name='unique_rendition'),
+        ),
+    ]
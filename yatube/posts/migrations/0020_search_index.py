@@ -0,0 +1,63 @@
+from django.db import migrations
+
+# posts.stemmer — чистая функция без моделей и задач; остальное
+# (схема и заполнение) записано здесь, чтобы правки posts.search
+# не меняли уже примененную миграцию
+from posts.stemmer import stem_words
+
+SQLITE_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS posts_search USING fts5("
+    "body, tokenize = 'unicode61 remove_diacritics 2')",
+]
+POSTGRES_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS posts_search ("
+    "kind varchar(10) NOT NULL, object_id integer NOT NULL, "
+    "body tsvector NOT NULL, PRIMARY KEY (kind, object_id))",
+    "CREATE INDEX IF NOT EXISTS posts_search_body_idx "
+    "ON posts_search USING gin (body)",
+]
+POSTGRES_BACKFILL = [
+    "INSERT INTO posts_search (kind, object_id, body) "
+    "SELECT 'post', id, to_tsvector('russian', text) FROM posts_post",
+    "INSERT INTO posts_search (kind, object_id, body) "
+    "SELECT 'comment', id, to_tsvector('russian', text) "
+    "FROM posts_comment",
+]
+# rowid в FTS5 кодирует вид и id: id * 2 + (0 — пост, 1 — комментарий)
+SQLITE_KINDS = (('Post', 0), ('Comment', 1))
+
+
+def create_index(apps, schema_editor):
+    conn = schema_editor.connection
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            for statement in POSTGRES_SCHEMA + POSTGRES_BACKFILL:
+                cursor.execute(statement)
+        elif conn.vendor == 'sqlite':
+            for statement in SQLITE_SCHEMA:
+                cursor.execute(statement)
+            for model_name, kind in SQLITE_KINDS:
+                model = apps.get_model('posts', model_name)
+                rows = model.objects.order_by().values_list('pk', 'text')
+                cursor.executemany(
+                    'INSERT INTO posts_search (rowid, body) VALUES (%s, %s)',
+                    [(pk * 2 + kind, ' '.join(stem_words(text)))
+                     for pk, text in rows.iterator()])
+
+
+def drop_index(apps, schema_editor):
+    conn = schema_editor.connection
+    if conn.vendor in ('sqlite', 'postgresql'):
+        with conn.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS posts_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_rendition_formats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.db import migrations
+
+# копия timeline.REBUILD_SQL: миграция не зависит от текущего кода
+BACKFILL_SQL = '''
+    INSERT INTO posts_timelineentry (user_id, post_id, pub_date)
+    SELECT user_id, post_id, pub_date FROM (
+        SELECT f.user_id, p.post_id, p.pub_date,
+               ROW_NUMBER() OVER (PARTITION BY f.user_id
+                                  ORDER BY p.pub_date DESC, p.post_id DESC
+                                  ) AS position
+        FROM posts_follow f
+        JOIN (SELECT id AS post_id, author_id, pub_date,
+                     ROW_NUMBER() OVER (PARTITION BY author_id
+                                        ORDER BY pub_date DESC, id DESC
+                                        ) AS position
+              FROM posts_post) p
+          ON p.author_id = f.author_id AND p.position <= %s
+        WHERE f.author_id NOT IN (
+            SELECT author_id FROM posts_follow
+            GROUP BY author_id HAVING COUNT(*) > %s)
+    ) ranked
+    WHERE position <= %s
+'''
+
+
+def backfill(apps, schema_editor):
+    """ Ленты для подписок, появившихся до TimelineEntry """
+    length = settings.TIMELINE_LENGTH
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('DELETE FROM posts_timelineentry')
+        cursor.execute(BACKFILL_SQL,
+                       [length, settings.TIMELINE_FANOUT_LIMIT, length])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0022_timeline_key_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
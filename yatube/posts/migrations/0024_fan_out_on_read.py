@@ -0,0 +1,31 @@
+# Generated by Django 2.2.9 on 2026-10-18 20:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_celebrities(apps, schema_editor):
+    """ Авторы, которых 0023 не разложила по лентам """
+    Follow = apps.get_model('posts', 'Follow')
+    UserCounters = apps.get_model('posts', 'UserCounters')
+    celebrities = Follow.objects.values('author_id').annotate(
+        total=models.Count('pk')).filter(
+        total__gt=settings.TIMELINE_FANOUT_LIMIT).values('author_id')
+    UserCounters.objects.filter(user_id__in=celebrities).update(
+        fan_out_on_read=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0023_backfill_timelines'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercounters',
+            name='fan_out_on_read',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_celebrities, migrations.RunPython.noop),
+    ]
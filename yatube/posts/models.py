@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -13,7 +15,28 @@ class Group(models.Model):
         return f'{self.slug}: {self.title}'
 
 
-class Post(models.Model):
+class PostQuerySet(models.QuerySet):
+    def feed(self):
+        """
+        Посты для ленты: автор и группа подтягиваются одним JOIN,
+        а число комментариев хранится в самом посте (comments_count)
+        """
+        return self.select_related('author', 'group').prefetch_related(
+            'renditions')
+
+
+class AtomicSaveMixin:
+    """
+    Сохранение вместе с обработчиками post_save в одной транзакции:
+    фоновые задачи (posts/tasks.py) ставятся в очередь вместе с записью
+    """
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class Post(AtomicSaveMixin, models.Model):
     text = models.TextField()
     pub_date = models.DateTimeField(
         verbose_name='date published',
@@ -32,15 +55,94 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True,
         null=True)
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            # ленты читаются курсором по (pub_date, id), см. paginator.py
+            models.Index(fields=['pub_date', 'id'],
+                         name='post_date_idx'),
+            models.Index(fields=['author', 'pub_date', 'id'],
+                         name='post_author_date_idx'),
+            models.Index(fields=['group', 'pub_date', 'id'],
+                         name='post_group_date_idx'),
+        ]
 
     def __str__(self):
         return f'{self.pub_date.date()} {self.text[:15]} ({self.pk})'
 
+    def picture(self, name):
+        """
+        Набор готовых копий картинки для <picture> по имени из
+        POST_IMAGE_RENDITIONS или None, пока фоновая задача их не сделала:
+        sources — современные форматы, img и srcset — копии в формате
+        оригинала. Берется из prefetch renditions
+        """
+        by_format = {}
+        for rendition in self.renditions.all():
+            if rendition.name == name:
+                by_format.setdefault(rendition.format, []).append(rendition)
+        fallback = by_format.pop(Rendition.ORIGINAL, None)
+        if not fallback:
+            return None
+        return {
+            'img': max(fallback, key=lambda rendition: rendition.width),
+            'srcset': Rendition.srcset(fallback),
+            'sizes': settings.POST_IMAGE_RENDITIONS[name].get('sizes', ''),
+            'sources': [
+                {'type': f'image/{image_format}',
+                 'srcset': Rendition.srcset(renditions)}
+                for image_format, renditions in sorted(by_format.items())
+            ],
+        }
+
+    @property
+    def card_picture(self):
+        return self.picture('card')
+
+
+class Rendition(models.Model):
+    """
+    Заранее посчитанная копия Post.image одной ширины в одном формате:
+    шаблоны берут адрес и размеры отсюда и не трогают PIL при рендере.
+    Создается задачей из posts/renditions.py после сохранения поста
+    """
+    # копии в формате исходной картинки — запасной вариант для <img>
+    ORIGINAL = 'original'
 
-class Comment(models.Model):
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='renditions')
+    name = models.CharField(max_length=50)
+    format = models.CharField(max_length=10, default=ORIGINAL)
+    url = models.CharField(max_length=500)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'name', 'format', 'width'],
+                                    name='unique_rendition'),
+        ]
+
+    def __str__(self):
+        return (f'{self.post_id} {self.name} {self.format} '
+                f'{self.width}x{self.height}')
+
+    @staticmethod
+    def srcset(renditions):
+        return ', '.join(
+            f'{rendition.url} {rendition.width}w'
+            for rendition in sorted(renditions, key=lambda r: r.width))
+
+
+class Comment(AtomicSaveMixin, models.Model):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -57,22 +159,58 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(fields=['post', 'created'],
+                         name='comment_post_created_idx'),
+        ]
 
     def __str__(self):
         return f'{self.author.username} {self.text[:15]} ({self.pk})'
 
 
 class FollowManager(models.Manager):
+    def followed_ids(self, user, authors):
+        """
+        Множество id авторов из authors, на которых подписан user,
+        одним запросом на весь список. Ответы запоминаются на объекте
+        пользователя (request.user живет ровно один запрос), поэтому
+        повторные вопросы о тех же авторах запросов не делают.
+
+        :param authors: пользователи или их id
+        """
+        if not user.is_authenticated:
+            return set()
+        ids = {getattr(author, 'pk', author) for author in authors}
+        memo = getattr(user, '_followed_ids', None)
+        if memo is None:
+            memo = {}
+            user._followed_ids = memo
+        missing = ids - memo.keys()
+        if missing:
+            found = set(self.model.objects.filter(
+                user=user, author__in=missing,
+            ).values_list('author_id', flat=True))
+            memo.update({pk: pk in found for pk in missing})
+        return {pk for pk in ids if memo[pk]}
+
+    def forget(self, user):
+        """ Сбрасывает запомненные followed_ids после изменения подписок """
+        try:
+            del user._followed_ids
+        except AttributeError:
+            pass
+
     def is_follow(self, author, user):
-        if user.is_authenticated:
-            return super().filter(author=author, user=user).exists()
-        return False
+        return author.pk in self.followed_ids(user, [author])
 
     def posts(self):
+        """
+        Посты избранных авторов. Ленту /follow/ читает не этот JOIN,
+        а TimelinePaginator из posts/timeline.py
+        """
         authors = self.all().values('author_id')
-        posts_list = Post.objects.filter(
+        return Post.objects.feed().filter(
             author__in=authors).order_by('-pub_date')
-        return posts_list
 
     def check_related_name(self, user_obj):
         """
@@ -101,6 +239,41 @@ class FollowManager(models.Manager):
         user, author = self.check_related_name(user_obj)
         return self.is_follow(author=author, user=user)
 
+    def follow(self, user, author):
+        """
+        Подписка одним INSERT без предварительного SELECT: повтор ловим
+        по уникальному ограничению unique_follow. Возвращает новое
+        состояние: подписан ли user на author
+        """
+        if user == author:
+            return False
+        self.forget(user)
+        try:
+            with transaction.atomic():
+                self.model.objects.create(user=user, author=author)
+        except IntegrityError:
+            pass
+        return True
+
+    def unfollow(self, user, author):
+        """ Отписка одним DELETE, возвращает новое состояние (False) """
+        self.forget(user)
+        self.model.objects.filter(user=user, author=author).delete()
+        return False
+
+    def toggle(self, user, author):
+        """
+        Переключает подписку без гонки «проверили, потом записали»:
+        сначала пробуем удалить, и только если удалять было нечего,
+        подписываемся. Возвращает новое состояние
+        """
+        self.forget(user)
+        deleted, _ = self.model.objects.filter(
+            user=user, author=author).delete()
+        if deleted:
+            return False
+        return self.follow(user, author)
+
     def append(self, user_obj):
         """
         Универасальный метод добавить как любимого автора так и подписчика
@@ -109,24 +282,20 @@ class FollowManager(models.Manager):
         author.following.append(user)
         """
         user, author = self.check_related_name(user_obj)
-        if author != user:
-            self.get_or_create(user=user, author=author)
+        return self.follow(user, author)
 
     def remove(self, user_obj):
         """ Универсальный метод по удалению любимого автора или подписчика """
         user, author = self.check_related_name(user_obj)
-        follow = self.filter(user=user, author=author)
-        follow.delete()
+        return self.unfollow(user, author)
 
     def switch(self, user_obj):
         """ Метод который позволят переключать состояние: подписан/нет """
-        if self.contains(user_obj):
-            self.remove(user_obj)
-        else:
-            self.append(user_obj)
+        user, author = self.check_related_name(user_obj)
+        return self.toggle(user, author)
 
 
-class Follow(models.Model):
+class Follow(AtomicSaveMixin, models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -139,8 +308,103 @@ class Follow(models.Model):
     objects = FollowManager()
 
     class Meta:
-        models.UniqueConstraint(fields=['user', 'author'],
-                                name='unique_follow')
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'author'],
+                                    name='unique_follow'),
+        ]
 
     def __str__(self):
         return f'{self.user.username} follow to {self.author.username}'
+
+
+class TimelineEntry(models.Model):
+    """
+    Материализованная лента подписок: при публикации поста его id
+    раскладывается по лентам подписчиков автора (fan-out-on-write).
+    pub_date продублирован из поста, чтобы обрезать ленту без JOIN.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries')
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries')
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_timeline_entry'),
+        ]
+        indexes = [
+            # лента листается курсором по (pub_date, post_id), см. timeline.py
+            models.Index(fields=['user', 'pub_date', 'post'],
+                         name='timeline_user_key_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} <- {self.post_id}'
+
+
+class UserCounters(models.Model):
+    """
+    Денормализованные счетчики пользователя для profile_side.html.
+    Обновляются сигналами в posts/counters.py, пересчитываются
+    командой manage.py recount_counters
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counters')
+    followers = models.PositiveIntegerField(default=0)
+    following = models.PositiveIntegerField(default=0)
+    posts = models.PositiveIntegerField(default=0)
+    # «звезда»: посты не раскладываются по лентам, а подмешиваются при
+    # чтении (posts/timeline.py). Флаг не снимается: иначе посты,
+    # пропущенные при раскладке, пропали бы из лент
+    fan_out_on_read = models.BooleanField(default=False)
+
+    def __str__(self):
+        return (f'{self.user_id}: {self.followers}/{self.following}'
+                f'/{self.posts}')
+
+
+class Task(models.Model):
+    """
+    Отложенный вызов функции-задачи при TASK_QUEUE = 'db' (posts/tasks.py).
+    Выполненные задачи удаляются; упавшие TASK_MAX_ATTEMPTS раз остаются
+    со статусом failed и текстом последней ошибки
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = [
+        (QUEUED, 'в очереди'),
+        (RUNNING, 'выполняется'),
+        (FAILED, 'не удалась'),
+    ]
+
+    name = models.CharField(max_length=200)
+    args = models.TextField(default='[]')
+    status = models.CharField(
+        max_length=10,
+        choices=STATUSES,
+        default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    # до этого времени задача занята воркером, потом ее можно забрать снова
+    locked_until = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'],
+                         name='task_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name}{self.args} ({self.status})'
@@ -0,0 +1,248 @@
+import base64
+import math
+from datetime import datetime
+from urllib.parse import urlencode
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+# id вне BIGINT база не примет (SQLite: OverflowError), это битый курсор
+MIN_ID, MAX_ID = -2 ** 63, 2 ** 63 - 1
+
+
+def encode_cursor(obj, date_field='pub_date') -> str:
+    """ Курсор — пара (дата, id) крайнего объекта на странице """
+    raw = f'{getattr(obj, date_field).isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """ Возвращает (дата, id) или None, если курсор битый """
+    if not token:
+        return None
+    try:
+        padding = '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(token + padding).decode()
+        date, pk = raw.rsplit('|', 1)
+        date = parse_datetime(date)
+        pk = int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    # наивная дата при USE_TZ дала бы RuntimeWarning при сравнении
+    if not isinstance(date, datetime) or date.tzinfo is None:
+        return None
+    if not MIN_ID <= pk <= MAX_ID:
+        return None
+    return date, pk
+
+
+def decode_id(token):
+    """ Курсор только по id (API) или None, если он битый """
+    try:
+        pk = int(token)
+    except (TypeError, ValueError):
+        return None
+    return pk if MIN_ID <= pk <= MAX_ID else None
+
+
+def to_int(value, default=0):
+    try:
+        return max(int(value), default)
+    except (TypeError, ValueError):
+        return default
+
+
+class CursorPage:
+    """
+    Страница ленты с интерфейсом, похожим на django.core.paginator.Page:
+    шаблоны по-прежнему итерируются по page и спрашивают has_other_pages.
+    """
+
+    def __init__(self, object_list, paginator, number,
+                 has_previous, has_next, pages_before, pages_after):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.number = number
+        self._has_previous = has_previous
+        self._has_next = has_next
+        self.pages_before = pages_before
+        self.pages_after = pages_after
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __repr__(self):
+        return f'<CursorPage {self.number}>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    def _url(self, **params):
+        params = {key: value for key, value in params.items() if value}
+        return '?' + urlencode(params) if params else '?'
+
+    def cursor(self, obj):
+        return encode_cursor(obj, self.paginator.date_field)
+
+    def page_url(self, number):
+        """ Ссылка на страницу number из окна вокруг текущей """
+        if number == 1:
+            return self._url()
+        per_page = self.paginator.per_page
+        if number > self.number:
+            skip = (number - self.number - 1) * per_page
+            return self._url(before=self.cursor(self.object_list[-1]),
+                             skip=skip, page=number)
+        skip = (self.number - number - 1) * per_page
+        return self._url(after=self.cursor(self.object_list[0]),
+                         skip=skip, page=number)
+
+    def next_page_url(self):
+        return self.page_url(self.number + 1)
+
+    def previous_page_url(self):
+        return self.page_url(self.number - 1)
+
+    @property
+    def window(self):
+        """ Ограниченное окно номеров страниц вокруг текущей """
+        numbers = range(self.number - self.pages_before,
+                        self.number + self.pages_after + 1)
+        return [
+            {'number': number,
+             'url': self.page_url(number),
+             'current': number == self.number}
+            for number in numbers
+        ]
+
+
+class CursorPaginator:
+    """
+    Пагинация по ключу (дата, id) вместо OFFSET + COUNT(*).
+    По умолчанию дата — pub_date поста, для комментариев — created.
+
+    ?before=<курсор> — посты старше курсора, ?after=<курсор> — новее.
+    Каждая страница — это выборка по индексу с LIMIT, поэтому глубокие
+    страницы стоят столько же, сколько первая. Номер страницы (?page=)
+    только подпись, ?skip= сдвигает на несколько страниц в пределах окна.
+    Общее число постов считается по желанию и кешируется по count_key.
+    """
+    window = 2
+    count_timeout = 5 * 60
+
+    def __init__(self, object_list, per_page, count_key=None,
+                 date_field='pub_date', key_field='pk'):
+        self.date_field = date_field
+        self.key_field = key_field
+        self.object_list = object_list.order_by(
+            f'-{date_field}', f'-{key_field}')
+        self.per_page = per_page
+        self.count_key = count_key
+
+    @cached_property
+    def count(self):
+        """ Приблизительное число постов, None если счетчик не нужен """
+        from posts.cache import cached
+
+        if self.count_key is None:
+            return None
+        count, _ = cached(f'paginator_count:{self.count_key}',
+                          self.object_list.count, self.count_timeout)
+        return count
+
+    @property
+    def num_pages(self):
+        count = self.count
+        if count is None:
+            return None
+        return max(math.ceil(count / self.per_page), 1)
+
+    # внешнее условие по одной дате дает планировщику диапазон по индексу
+    def older_than(self, cursor, key_field=None):
+        date, pk = cursor
+        field = self.date_field
+        key_field = key_field or self.key_field
+        return Q(**{f'{field}__lte': date}) & (
+            Q(**{f'{field}__lt': date}) | Q(**{f'{key_field}__lt': pk}))
+
+    def newer_than(self, cursor, key_field=None):
+        date, pk = cursor
+        field = self.date_field
+        key_field = key_field or self.key_field
+        return Q(**{f'{field}__gte': date}) & (
+            Q(**{f'{field}__gt': date}) | Q(**{f'{key_field}__gt': pk}))
+
+    def from_cursor(self, queryset, cursor, newer, key_field=None):
+        """
+        Выборка по одну сторону от курсора, ближние к нему первыми:
+        старше курсора или (newer) новее. queryset упорядочен от новых
+        """
+        if cursor is None:
+            return queryset
+        if newer:
+            return queryset.filter(
+                self.newer_than(cursor, key_field)).reverse()
+        return queryset.filter(self.older_than(cursor, key_field))
+
+    def fetch(self, cursor, newer, start, stop):
+        """ Объекты [start:stop] от курсора в порядке ленты (новые первыми) """
+        objects = list(self.from_cursor(
+            self.object_list, cursor, newer)[start:stop])
+        return objects[::-1] if newer else objects
+
+    def found(self, cursor, newer, limit):
+        """ Сколько объектов (не больше limit) лежит по эту сторону курсора """
+        rows = self.from_cursor(self.object_list, cursor, newer)
+        return len(rows.values_list('pk', flat=True)[:limit])
+
+    def pages_from(self, obj, newer):
+        """ Сколько страниц (не больше окна) лежит по эту сторону obj """
+        cursor = (getattr(obj, self.date_field), obj.pk)
+        found = self.found(cursor, newer, self.per_page * self.window)
+        return math.ceil(found / self.per_page)
+
+    def get_page(self, before=None, after=None, skip=0, number=1):
+        before, after = decode_cursor(before), decode_cursor(after)
+        skip = min(to_int(skip), self.per_page * (self.window - 1))
+        number = to_int(number, 1)
+        stop = skip + self.per_page
+
+        if after is not None:
+            object_list = self.fetch(after, True, skip, stop)
+        elif before is not None:
+            object_list = self.fetch(before, False, skip, stop)
+        else:
+            object_list = self.fetch(None, False, 0, self.per_page)
+
+        if not object_list and (before or after):
+            object_list = self.fetch(None, False, 0, self.per_page)
+            before = after = None
+
+        if before is None and after is None:
+            pages_before = 0
+        else:
+            pages_before = self.pages_from(object_list[0], newer=True)
+        if not object_list:
+            pages_after = 0
+        else:
+            pages_after = self.pages_from(object_list[-1], newer=False)
+
+        if not pages_before:
+            number = 1
+        number = max(number, pages_before + 1)
+
+        return CursorPage(object_list, self, number,
+                          has_previous=bool(pages_before),
+                          has_next=bool(pages_after),
+                          pages_before=pages_before,
+                          pages_after=pages_after)
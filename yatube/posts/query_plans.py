@@ -0,0 +1,88 @@
+"""
+Проверка планов запросов лент: ни один горячий запрос не должен
+читать таблицу целиком или сортировать ее во временной структуре.
+
+Используется командой manage.py check_query_plans и тестами.
+Понимает EXPLAIN QUERY PLAN SQLite и EXPLAIN PostgreSQL.
+"""
+import re
+
+from django.db import connection
+from django.utils import timezone
+
+from posts.models import Comment, Follow, Group, Post, User
+from posts.paginator import CursorPaginator
+from posts.timeline import TimelinePaginator
+
+FULL_SCAN = {
+    'sqlite': re.compile(r'\bSCAN (TABLE )?\w+(?!.*\bUSING\b)'),
+    'postgresql': re.compile(r'\bSeq Scan on\b'),
+}
+# SQLite: проход по индексу в порядке сортировки допустим только с LIMIT
+INDEX_WALK = {
+    'sqlite': re.compile(r'\bSCAN (TABLE )?\w+ USING (COVERING )?INDEX\b'),
+}
+SORT = {
+    'sqlite': re.compile(r'\bUSE TEMP B-TREE FOR ORDER BY\b'),
+    'postgresql': re.compile(r'^\s*(->\s*)?Sort\b'),
+}
+
+
+def plan_problems(queryset, allow_sort=False) -> list:
+    """ Строки плана с полным сканированием (и сортировкой, если нельзя) """
+    vendor = connection.vendor
+    if vendor not in FULL_SCAN:
+        return []
+    patterns = [FULL_SCAN[vendor]]
+    if queryset.query.high_mark is None and vendor in INDEX_WALK:
+        patterns.append(INDEX_WALK[vendor])
+    if not allow_sort:
+        patterns.append(SORT[vendor])
+    return [
+        line for line in queryset.explain().splitlines()
+        if any(pattern.search(line) for pattern in patterns)
+    ]
+
+
+def feed_queries():
+    """
+    Горячие запросы лент в том виде, в котором их строят представления.
+    Возвращает список (название, queryset, можно ли сортировать)
+    """
+    user = User.objects.order_by('pk').first() or User(pk=0)
+    group = Group.objects.order_by('pk').first() or Group(pk=0)
+    cursor = (timezone.now(), 0)
+    paginator = CursorPaginator(Post.objects.feed(), 10)
+    posts = paginator.object_list
+    page = slice(0, paginator.per_page)
+    timeline = TimelinePaginator(user, 10)
+    entries = timeline.object_list.values_list('pub_date', 'post_id')
+    return [
+        ('index', posts[page], False),
+        ('index_cursor', posts.filter(
+            paginator.older_than(cursor))[page], False),
+        ('group', posts.filter(group=group)[page], False),
+        ('group_cursor', posts.filter(group=group).filter(
+            paginator.older_than(cursor))[page], False),
+        ('profile', posts.filter(author=user)[page], False),
+        ('profile_cursor', posts.filter(author=user).filter(
+            paginator.older_than(cursor))[page], False),
+        ('follow', entries[page], False),
+        ('follow_cursor', timeline.from_cursor(
+            entries, cursor, newer=False)[page], False),
+        ('follow_newer', timeline.from_cursor(
+            entries, cursor, newer=True)[page], False),
+        ('comments', Comment.objects.filter(post__pk=0).select_related(
+            'author')[page], False),
+        ('is_follow', Follow.objects.filter(user=user, author=user), False),
+    ]
+
+
+def check_feed_plans() -> dict:
+    """ {название запроса: проблемные строки плана} для плохих планов """
+    problems = {}
+    for name, queryset, allow_sort in feed_queries():
+        lines = plan_problems(queryset, allow_sort=allow_sort)
+        if lines:
+            problems[name] = lines
+    return problems
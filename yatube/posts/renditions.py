@@ -0,0 +1,119 @@
+"""
+Подготовка копий картинок постов заранее, а не во время рендера.
+
+После сохранения поста с новой картинкой (new_post, post_edit) задача
+уходит в очередь (posts/tasks.py). Для каждой копии из POST_IMAGE_RENDITIONS он
+обрезает картинку под нужные пропорции и делает несколько ширин
+в современных форматах из POST_IMAGE_FORMATS (если их умеет Pillow)
+и в формате оригинала. Имена файлов — хеш содержимого, поэтому
+одинаковые копии не дублируются и их можно кешировать навсегда.
+Адреса и размеры сохраняются в Rendition, шаблоны никогда не ждут PIL.
+"""
+import hashlib
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from posts.cache import bump
+from posts.models import Post, Rendition
+from posts.signals import post_scopes
+from posts.tasks import task
+
+UPLOAD_TO = 'renditions/'
+# параметры сохранения: формат Pillow, расширение и качество
+FORMATS = {
+    'avif': ('AVIF', 'avif', {'quality': 60}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 85, 'optimize': True,
+                             'progressive': True}),
+    'png': ('PNG', 'png', {'optimize': True}),
+}
+
+
+def supported_formats():
+    """ Современные форматы из настроек, которые умеет сохранять Pillow """
+    Image.init()
+    return [image_format for image_format in settings.POST_IMAGE_FORMATS
+            if FORMATS[image_format][0] in Image.SAVE]
+
+
+def original_format(image):
+    """ Формат оригинала для запасной копии: PNG остается PNG """
+    return 'png' if image.format == 'PNG' else 'jpeg'
+
+
+def encode(image, image_format):
+    pil_format, extension, options = FORMATS[image_format]
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    content = buffer.getvalue()
+    digest = hashlib.sha256(content).hexdigest()[:20]
+    return f'{UPLOAD_TO}{digest}.{extension}', content
+
+
+def store(name, content):
+    """ Сохраняет файл, если такого содержимого еще нет в хранилище """
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(content))
+    return default_storage.url(name)
+
+
+def build(post, image):
+    """ Все копии картинки поста: список несохраненных Rendition """
+    modern = supported_formats()
+    fallback = original_format(image)
+    result = []
+    for name, options in settings.POST_IMAGE_RENDITIONS.items():
+        width, height = options['size']
+        cropped = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        for rendition_width in options.get('widths', [width]):
+            rendition_height = round(height * rendition_width / width)
+            resized = cropped.resize(
+                (rendition_width, rendition_height), Image.LANCZOS)
+            for image_format in modern + [fallback]:
+                file_name, content = encode(resized, image_format)
+                result.append(Rendition(
+                    post=post,
+                    name=name,
+                    format=(Rendition.ORIGINAL if image_format == fallback
+                            else image_format),
+                    url=store(file_name, content),
+                    width=rendition_width,
+                    height=rendition_height,
+                ))
+    return result
+
+
+def invalidate(post):
+    """ Закешированные ленты должны увидеть новые копии """
+    bump(*post_scopes(post))
+
+
+@task
+def generate(post_id):
+    """ Делает все копии картинки поста """
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None:
+        return
+    post.renditions.all().delete()
+    if not post.image:
+        invalidate(post)
+        return
+    with post.image.open('rb') as image_file:
+        image = Image.open(image_file)
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+        image.format = image_format
+        renditions = build(post, image)
+    Rendition.objects.bulk_create(renditions)
+    invalidate(post)
+
+
+def schedule(post):
+    """ Ставит генерацию копий в очередь задач """
+    generate.delay(post.pk)
@@ -0,0 +1,188 @@
+"""
+Полнотекстовый поиск по постам и комментариям.
+
+Индекс — отдельная таблица posts_search, ее создает миграция под
+текущую базу:
+  * SQLite — виртуальная таблица FTS5, текст и запрос приводятся
+    к основам слов стеммером posts/stemmer.py, ранжирование bm25;
+  * PostgreSQL — tsvector с GIN-индексом и словарем 'russian',
+    ранжирование ts_rank.
+На остальных базах поиск откатывается на icontains.
+Индекс обновляется фоновой задачей reindex по сигналам
+(posts/signals.py), целиком перестраивается командой
+manage.py rebuild_search_index.
+"""
+from itertools import islice
+
+from django.db import connection, transaction
+
+from posts.stemmer import stem_words
+from posts.tasks import task
+
+POST = 'post'
+COMMENT = 'comment'
+# в FTS5 удаление по rowid быстрое, поэтому rowid кодирует вид и id
+KINDS = {POST: 0, COMMENT: 1}
+
+SQLITE_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS posts_search USING fts5("
+    "body, tokenize = 'unicode61 remove_diacritics 2')",
+]
+POSTGRES_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS posts_search ("
+    "kind varchar(10) NOT NULL, object_id integer NOT NULL, "
+    "body tsvector NOT NULL, PRIMARY KEY (kind, object_id))",
+    "CREATE INDEX IF NOT EXISTS posts_search_body_idx "
+    "ON posts_search USING gin (body)",
+]
+DROP_SCHEMA = ['DROP TABLE IF EXISTS posts_search']
+REBUILD_BATCH = 2000
+
+
+def enabled(conn=connection):
+    return conn.vendor in ('sqlite', 'postgresql')
+
+
+def create_schema(conn=connection):
+    statements = {
+        'sqlite': SQLITE_SCHEMA,
+        'postgresql': POSTGRES_SCHEMA,
+    }.get(conn.vendor, [])
+    with conn.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def drop_schema(conn=connection):
+    if enabled(conn):
+        with conn.cursor() as cursor:
+            for statement in DROP_SCHEMA:
+                cursor.execute(statement)
+
+
+def rowid(kind, object_id):
+    return object_id * len(KINDS) + KINDS[kind]
+
+
+def fts_query(query):
+    """ Запрос FTS5 из основ слов; кавычки не дают внедрить синтаксис """
+    return ' '.join(f'"{word}"' for word in stem_words(query))
+
+
+def index(kind, object_id, text, conn=connection):
+    if not enabled(conn):
+        return
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute('DELETE FROM posts_search WHERE rowid = %s',
+                           [rowid(kind, object_id)])
+            cursor.execute(
+                'INSERT INTO posts_search (rowid, body) VALUES (%s, %s)',
+                [rowid(kind, object_id), ' '.join(stem_words(text))])
+        else:
+            cursor.execute(
+                'INSERT INTO posts_search (kind, object_id, body) '
+                "VALUES (%s, %s, to_tsvector('russian', %s)) "
+                'ON CONFLICT (kind, object_id) '
+                'DO UPDATE SET body = EXCLUDED.body',
+                [kind, object_id, text])
+
+
+def remove(kind, object_id):
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('DELETE FROM posts_search WHERE rowid = %s',
+                           [rowid(kind, object_id)])
+        else:
+            cursor.execute(
+                'DELETE FROM posts_search '
+                'WHERE kind = %s AND object_id = %s',
+                [kind, object_id])
+
+
+@task
+def reindex(kind, object_id):
+    """ Индекс записи по ее тексту в базе; удаленная убирается """
+    from posts.models import Comment, Post
+
+    model = Post if kind == POST else Comment
+    text = model.objects.filter(pk=object_id).values_list(
+        'text', flat=True).first()
+    if text is None:
+        remove(kind, object_id)
+    else:
+        index(kind, object_id, text)
+
+
+def search_ids(query, kind, limit, offset=0):
+    """ id объектов вида kind по убыванию релевантности """
+    from posts.models import Comment, Post
+
+    if not query.strip():
+        return []
+    if not enabled():
+        model = Post if kind == POST else Comment
+        return list(model.objects.filter(text__icontains=query).order_by(
+            '-pk').values_list('pk', flat=True)[offset:offset + limit])
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            match = fts_query(query)
+            if not match:
+                return []
+            cursor.execute(
+                'SELECT rowid FROM posts_search '
+                'WHERE posts_search MATCH %s AND rowid %% %s = %s '
+                'ORDER BY bm25(posts_search) LIMIT %s OFFSET %s',
+                [match, len(KINDS), KINDS[kind], limit, offset])
+            return [row[0] // len(KINDS) for row in cursor.fetchall()]
+        cursor.execute(
+            'SELECT object_id FROM posts_search, '
+            "plainto_tsquery('russian', %s) query "
+            'WHERE kind = %s AND body @@ query '
+            'ORDER BY ts_rank(body, query) DESC LIMIT %s OFFSET %s',
+            [query, kind, limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def rebuild():
+    """
+    Перестраивает индекс целиком одной транзакцией, возвращает число
+    записей. PostgreSQL считает tsvector сам (INSERT ... SELECT), для
+    SQLite основы слов считаются здесь и вставляются пачками
+    """
+    from posts.models import Comment, Post
+
+    if not enabled():
+        return 0
+    create_schema()
+    total = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('DELETE FROM posts_search')
+        for kind, model in ((POST, Post), (COMMENT, Comment)):
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    'INSERT INTO posts_search (kind, object_id, body) '
+                    "SELECT %s, id, to_tsvector('russian', text) "
+                    f'FROM {model._meta.db_table}', [kind])
+                total += cursor.rowcount
+                continue
+            rows = model.objects.order_by().values_list(
+                'pk', 'text').iterator(chunk_size=REBUILD_BATCH)
+            while True:
+                batch = [(rowid(kind, object_id), ' '.join(stem_words(text)))
+                         for object_id, text in islice(rows, REBUILD_BATCH)]
+                if not batch:
+                    break
+                cursor.executemany(
+                    'INSERT INTO posts_search (rowid, body) VALUES (%s, %s)',
+                    batch)
+                total += len(batch)
+    return total
+
+
+def ranked(queryset, ids):
+    """ Объекты queryset в порядке ids (порядке релевантности) """
+    objects = queryset.in_bulk(ids)
+    return [objects[pk] for pk in ids if pk in objects]
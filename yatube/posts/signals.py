@@ -0,0 +1,119 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from posts import counters, search, timeline
+from posts.cache import bump
+from posts.models import (Comment, Follow, Group, Post, User,
+                          UserCounters)
+
+
+def username(instance, field):
+    """ Имя пользователя из FK без лишнего запроса, если он уже загружен """
+    descriptor = getattr(type(instance), field)
+    if descriptor.is_cached(instance):
+        return getattr(instance, field).username
+    user_id = getattr(instance, f'{field}_id')
+    return User.objects.filter(pk=user_id).values_list(
+        'username', flat=True).first()
+
+
+def group_slugs(post):
+    """ Слаги текущей и исходной группы поста (при переносе нужны обе) """
+    ids = {post.group_id, getattr(post, '_loaded_group_id', None)} - {None}
+    if not ids:
+        return []
+    if Post.group.is_cached(post) and ids == {post.group_id}:
+        return [post.group.slug]
+    return Group.objects.filter(pk__in=ids).values_list('slug', flat=True)
+
+
+def post_scopes(post):
+    scopes = ['posts', f'author:{username(post, "author")}']
+    scopes.extend(f'group:{slug}' for slug in group_slugs(post))
+    return scopes
+
+
+@receiver(post_init, sender=Post)
+def remember_group(sender, instance, **kwargs):
+    instance._loaded_group_id = instance.group_id
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post(sender, instance, **kwargs):
+    bump(*post_scopes(instance))
+    instance._loaded_group_id = instance.group_id
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment(sender, instance, **kwargs):
+    bump(*post_scopes(instance.post))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group(sender, instance, **kwargs):
+    bump('posts', 'groups', f'group:{instance.slug}')
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow(sender, instance, **kwargs):
+    bump(f'author:{username(instance, "author")}',
+         f'author:{username(instance, "user")}',
+         f'follower:{instance.user_id}')
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        timeline.fan_out.delay(instance.pk)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        timeline.backfill.delay(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def drop_from_timeline(sender, instance, **kwargs):
+    timeline.drop.delay(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=User)
+def create_counters(sender, instance, created, **kwargs):
+    if created:
+        UserCounters.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def count_posts(sender, instance, created=True, **kwargs):
+    if created:
+        counters.refresh.delay(instance.author_id, 'posts')
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def count_comments(sender, instance, created=True, **kwargs):
+    if created:
+        counters.refresh_comments.delay(instance.post_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def count_follows(sender, instance, created=True, **kwargs):
+    if created:
+        counters.refresh.delay(instance.author_id, 'followers')
+        counters.refresh.delay(instance.user_id, 'following')
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Comment)
+def reindex_for_search(sender, instance, **kwargs):
+    kind = search.POST if sender is Post else search.COMMENT
+    search.reindex.delay(kind, instance.pk)
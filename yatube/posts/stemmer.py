@@ -0,0 +1,131 @@
+"""
+Стеммер русского языка по алгоритму Snowball (Портера).
+
+Нужен поиску на SQLite: FTS5 не умеет русскую морфологию, поэтому
+и текст, и запрос приводятся к основам слов до индексации.
+Слова без русских гласных (латиница, числа) возвращаются как есть.
+"""
+import re
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND = (
+    ('в', 'вши', 'вшись'),
+    ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'),
+)
+ADJECTIVE = (
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем',
+    'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю',
+    'ая', 'яя', 'ою', 'ею',
+)
+PARTICIPLE = (
+    ('ем', 'нн', 'вш', 'ющ', 'щ'),
+    ('ивш', 'ывш', 'ующ'),
+)
+REFLEXIVE = ('ся', 'сь')
+VERB = (
+    ('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет',
+     'ют', 'ны', 'ть', 'ешь', 'нно'),
+    ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй',
+     'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют',
+     'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'),
+)
+NOUN = (
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и',
+    'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о',
+    'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья', 'я',
+)
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+WORD = re.compile(r'\w+')
+
+
+def regions(word):
+    """ Начала областей RV и R2 (индексы в слове) """
+    rv = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+    r1 = r2 = len(word)
+    for i in range(1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def remove_ending(rv, endings):
+    """ Отрезает самое длинное из окончаний, если оно целиком в rv """
+    for ending in sorted(endings, key=len, reverse=True):
+        if rv.endswith(ending):
+            return rv[:-len(ending)], True
+    return rv, False
+
+
+def remove_grouped(rv, groups):
+    """
+    Первая группа окончаний удаляется, только если перед ней «а» или «я»,
+    вторая — всегда. Берется самое длинное подходящее окончание
+    """
+    first, second = groups
+    candidates = [(ending, True) for ending in first]
+    candidates += [(ending, False) for ending in second]
+    for ending, needs_a in sorted(candidates, key=lambda c: -len(c[0])):
+        if not rv.endswith(ending):
+            continue
+        stem = rv[:-len(ending)]
+        if needs_a and not stem.endswith(('а', 'я')):
+            continue
+        return stem, True
+    return rv, False
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    rv_start, r2_start = regions(word)
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # шаг 1
+    rv, found = remove_grouped(rv, PERFECTIVE_GERUND)
+    if not found:
+        rv, _ = remove_ending(rv, REFLEXIVE)
+        rv, found = remove_ending(rv, ADJECTIVE)
+        if found:
+            rv, _ = remove_grouped(rv, PARTICIPLE)
+        else:
+            rv, found = remove_grouped(rv, VERB)
+            if not found:
+                rv, _ = remove_ending(rv, NOUN)
+
+    # шаг 2
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # шаг 3: словообразовательные окончания только в R2
+    r2 = (prefix + rv)[r2_start:]
+    for ending in DERIVATIONAL:
+        if r2.endswith(ending):
+            rv = rv[:-len(ending)]
+            break
+
+    # шаг 4
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    else:
+        rv, found = remove_ending(rv, SUPERLATIVE)
+        if found and rv.endswith('нн'):
+            rv = rv[:-1]
+        elif rv.endswith('ь'):
+            rv = rv[:-1]
+    return prefix + rv
+
+
+def stem_words(text):
+    """ Основы всех слов текста в исходном порядке """
+    return [stem(word) for word in WORD.findall(text.lower())]
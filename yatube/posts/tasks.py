@@ -0,0 +1,199 @@
+"""
+Фоновые задачи для побочных эффектов записи: раскладка по лентам,
+счетчики, поисковый индекс, копии картинок. Запрос ограничивается
+основной записью, остальное делает очередь.
+
+Задача — функция с декоратором @task, ее аргументы — id и строки
+(их можно положить в JSON). f.delay(*args) ставит вызов в очередь
+по настройке TASK_QUEUE:
+    sync   — выполнить сразу (тесты и локальная разработка);
+    thread — после коммита в пул потоков этого процесса;
+    db     — строкой Task в той же транзакции, что и запись; очередь
+             разбирает manage.py run_tasks.
+Упавшая задача повторяется до TASK_MAX_ATTEMPTS раз с удваивающейся
+паузой, поэтому задачи пишутся идемпотентными: пересчитывают состояние
+по базе, а не применяют приращения.
+"""
+import json
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import update_wrapper
+
+from django.conf import settings
+from django.db import (DatabaseError, close_old_connections, connection,
+                       transaction)
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from posts.models import Task
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+class TaskFunction:
+    """ Обертка функции-задачи: обычный вызов плюс delay() """
+
+    def __init__(self, func):
+        update_wrapper(self, func)
+        self.func = func
+        self.name = f'{func.__module__}.{func.__qualname__}'
+
+    def __call__(self, *args):
+        return self.func(*args)
+
+    def __repr__(self):
+        return f'<task {self.name}>'
+
+    def delay(self, *args):
+        enqueue(self.name, args)
+
+
+def task(func):
+    return TaskFunction(func)
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.TASK_WORKERS,
+                                       thread_name_prefix='tasks')
+    return _executor
+
+
+def enqueue(name, args):
+    mode = settings.TASK_QUEUE
+    if mode == 'sync':
+        import_string(name)(*args)
+    elif mode == 'thread':
+        args = list(args)
+        transaction.on_commit(
+            lambda: executor().submit(run_with_retries, name, args))
+    elif mode == 'db':
+        Task.objects.create(name=name, args=json.dumps(list(args)))
+    else:
+        raise ValueError(f'Неизвестный режим TASK_QUEUE: {mode}')
+
+
+def backoff(attempt):
+    """ Пауза перед повтором: удваивается, плюс немного случайности """
+    delay = settings.TASK_RETRY_DELAY * 2 ** (attempt - 1)
+    return min(delay, settings.TASK_RETRY_MAX_DELAY) * random.uniform(1, 1.2)
+
+
+def run_with_retries(name, args):
+    """ Выполнение в пуле потоков (TASK_QUEUE = 'thread') """
+    try:
+        for attempt in range(1, settings.TASK_MAX_ATTEMPTS + 1):
+            try:
+                import_string(name)(*args)
+                return
+            except Exception:
+                logger.exception('Task %s%s failed, attempt %s',
+                                 name, tuple(args), attempt)
+                close_old_connections()
+            if attempt < settings.TASK_MAX_ATTEMPTS:
+                time.sleep(backoff(attempt))
+    finally:
+        close_old_connections()
+
+
+def due(now):
+    """ Созревшие задачи и задачи упавшего воркера (истек locked_until) """
+    return Task.objects.filter(
+        Q(status=Task.QUEUED) | Q(status=Task.RUNNING, locked_until__lt=now),
+        run_after__lte=now,
+    )
+
+
+def claim(limit):
+    """
+    Забирает до limit созревших задач из таблицы. Каждая забирается
+    UPDATE с тем же условием: без SKIP LOCKED (SQLite) два воркера могут
+    выбрать одни строки, но обновит каждую только один, и выполнит
+    воркер лишь те, что обновил сам
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        candidates = due(now).order_by('run_after', 'pk')
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        claimed = [
+            pk for pk in candidates.values_list('pk', flat=True)[:limit]
+            if due(now).filter(pk=pk).update(
+                status=Task.RUNNING,
+                attempts=F('attempts') + 1,
+                locked_until=now + timedelta(seconds=settings.TASK_LEASE))
+        ]
+        return list(Task.objects.filter(pk__in=claimed).order_by(
+            'run_after', 'pk'))
+
+
+def execute(item):
+    """ Выполняет задачу из таблицы: удачная удаляется, упавшая ждет """
+    try:
+        import_string(item.name)(*json.loads(item.args))
+    except Exception as error:
+        logger.exception('Task %s %s failed, attempt %s',
+                         item.name, item.args, item.attempts)
+        item.last_error = f'{type(error).__name__}: {error}'
+        item.locked_until = None
+        if item.attempts >= settings.TASK_MAX_ATTEMPTS:
+            item.status = Task.FAILED
+        else:
+            item.status = Task.QUEUED
+            item.run_after = timezone.now() + timedelta(
+                seconds=backoff(item.attempts))
+        item.save(update_fields=['status', 'run_after', 'locked_until',
+                                 'last_error'])
+        return False
+    else:
+        Task.objects.filter(pk=item.pk).delete()
+        return True
+
+
+def execute_in_thread(item):
+    try:
+        return execute(item)
+    finally:
+        close_old_connections()
+
+
+def work(workers=None, batch=None, once=False, poll=1.0):
+    """
+    Цикл воркера: забирает пачку задач и выполняет ее в пуле потоков.
+    workers=0 — в текущем потоке. once — выйти, когда очередь пуста.
+    Возвращает число выполненных и упавших задач
+    """
+    workers = settings.TASK_WORKERS if workers is None else workers
+    batch = batch or max(workers, 1) * 10
+    done = failed = 0
+    pool = ThreadPoolExecutor(workers, 'tasks') if workers else None
+    try:
+        while True:
+            try:
+                tasks = claim(batch)
+            except DatabaseError:
+                # база занята (SQLite: database is locked) или недоступна:
+                # воркер не падает, а пробует снова после паузы
+                logger.exception('Claiming tasks failed')
+                time.sleep(poll)
+                continue
+            if not tasks:
+                if once:
+                    return done, failed
+                time.sleep(poll)
+                continue
+            results = (pool.map(execute_in_thread, tasks) if pool
+                       else map(execute, tasks))
+            for ok in results:
+                done += ok
+                failed += not ok
+    finally:
+        if pool:
+            pool.shutdown()
@@ -0,0 +1,53 @@
+from django import template
+from django.conf import settings
+
+from posts.cache import cached, fragment_cache_key
+from posts.fragments import fill, is_skeleton
+
+register = template.Library()
+
+
+class FeedCacheNode(template.Node):
+    def __init__(self, nodelist, scope_parts, page):
+        self.nodelist = nodelist
+        self.scope_parts = scope_parts
+        self.page = page
+
+    def render_skeleton(self, context):
+        # в кеш попадает скелет, общий для всех пользователей
+        with context.push(page_skeleton=True):
+            return self.nodelist.render(context)
+
+    def render(self, context):
+        scope = ':'.join(
+            str(part.resolve(context)) for part in self.scope_parts)
+        page = self.page.resolve(context)
+        key = fragment_cache_key(scope, page)
+        value, _ = cached(key, lambda: self.render_skeleton(context),
+                          settings.FEED_CACHE_TIMEOUT, name='fragment')
+        if is_skeleton(context):
+            return value
+        return fill(value, context.get('request'))
+
+
+@register.tag
+def feed_cache(parser, token):
+    """
+    Кеширует фрагмент ленты до изменения ее постов:
+    {% feed_cache "group" group.slug page %} ... {% endfeed_cache %}
+
+    Все аргументы кроме последнего склеиваются через ":" в scope
+    (тот же, что сбрасывают сигналы в posts/signals.py),
+    последний — страница курсорного пагинатора.
+    """
+    nodelist = parser.parse(('endfeed_cache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError(
+            f'{tokens[0]} tag requires a scope and a page')
+    return FeedCacheNode(
+        nodelist,
+        [parser.compile_filter(part) for part in tokens[1:-1]],
+        parser.compile_filter(tokens[-1]),
+    )
@@ -0,0 +1,41 @@
+from django import template
+
+from posts.fragments import FRAGMENTS, is_skeleton, marker, render_fragment
+
+register = template.Library()
+
+
+class UserFragmentNode(template.Node):
+    def __init__(self, name, kwargs):
+        self.name = name
+        self.kwargs = kwargs
+
+    def render(self, context):
+        args = {key: value.resolve(context)
+                for key, value in self.kwargs.items()}
+        if is_skeleton(context):
+            return marker(self.name, args)
+        return render_fragment(self.name, args, context.get('request'))
+
+
+@register.tag
+def user_fragment(parser, token):
+    """
+    Кусочек страницы, зависящий от пользователя:
+    {% user_fragment "post_edit" author=post.author.username post_id=post.id %}
+
+    Аргументы — простые значения, шаблон и контекст кусочка
+    описаны в posts.fragments.FRAGMENTS.
+    """
+    tokens = token.split_contents()
+    if len(tokens) < 2:
+        raise template.TemplateSyntaxError(
+            f'{tokens[0]} tag requires a fragment name')
+    name = tokens[1].strip('"\'')
+    if name not in FRAGMENTS:
+        raise template.TemplateSyntaxError(f'Unknown fragment {name}')
+    kwargs = template.base.token_kwargs(tokens[2:], parser)
+    if len(kwargs) != len(tokens) - 2:
+        raise template.TemplateSyntaxError(
+            f'{tokens[0]} tag accepts only key=value arguments')
+    return UserFragmentNode(name, kwargs)
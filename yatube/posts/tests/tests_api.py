@@ -0,0 +1,114 @@
+from django.core.cache import cache
+from django.db import connection
+from django.shortcuts import reverse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from posts.models import Comment, Follow, Group, Post, User
+from posts.tests.tests_cache import LOCMEM_CACHES
+from posts.tests.utils import CommitCallbacksMixin
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestApiCase(CommitCallbacksMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='alice')
+        self.reader = User.objects.create(username='bob')
+        self.group = Group.objects.create(title='Котики', slug='cats',
+                                          description='Про котиков')
+        self.posts = [
+            Post.objects.create(author=self.user, text=f'Пост {i}',
+                                group=self.group)
+            for i in range(5)
+        ]
+        Comment.objects.create(author=self.reader, post=self.posts[0],
+                               text='Отличный пост')
+
+    def test_cursor_pagination(self):
+        url = reverse('api_posts') + '?limit=2'
+        seen = []
+        while url:
+            data = self.client.get(url).json()
+            self.assertLessEqual(len(data['results']), 2)
+            seen.extend(post['id'] for post in data['results'])
+            url = data['next']
+        self.assertEqual(seen, [post.pk for post in reversed(self.posts)])
+
+    def test_out_of_range_cursor_gives_first_page(self):
+        huge = '9' * 30
+        for name in ('api_groups', 'api_posts'):
+            response = self.client.get(reverse(name), {'before': huge})
+            self.assertEqual(response.status_code, 200, name)
+            self.assertTrue(response.json()['results'], name)
+
+    def test_sparse_fields(self):
+        response = self.client.get(reverse('api_posts'),
+                                   {'fields': 'id,author'})
+        self.assertEqual(response.json()['results'][0],
+                         {'id': self.posts[-1].pk, 'author': 'alice'})
+        response = self.client.get(reverse('api_posts'),
+                                   {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_resources(self):
+        post = self.posts[0]
+        self.assertEqual(
+            self.client.get(reverse('api_post', args=(post.pk,))).json()[
+                'comments_count'], 1)
+        comments = self.client.get(
+            reverse('api_comments', args=(post.pk,))).json()['results']
+        self.assertEqual([c['text'] for c in comments], ['Отличный пост'])
+        groups = self.client.get(reverse('api_groups')).json()['results']
+        self.assertEqual(groups[0]['slug'], 'cats')
+        group_posts = self.client.get(
+            reverse('api_group_posts', args=('cats',))).json()['results']
+        self.assertEqual(len(group_posts), 5)
+        user_posts = self.client.get(
+            reverse('api_user_posts', args=('bob',))).json()['results']
+        self.assertEqual(user_posts, [])
+
+    def test_not_found_is_json(self):
+        response = self.client.get(reverse('api_group_posts',
+                                           args=('dogs',)))
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('detail', response.json())
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_follows(self):
+        Follow.objects.follow(self.reader, self.user)
+        following = self.client.get(
+            reverse('api_following', args=('bob',))).json()['results']
+        self.assertEqual(following[0]['author'], 'alice')
+        followers = self.client.get(
+            reverse('api_followers', args=('alice',))).json()['results']
+        self.assertEqual(followers[0]['user'], 'bob')
+
+        self.assertEqual(self.client.get(reverse('api_follow')).status_code,
+                         401)
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('api_follow'))
+        self.assertEqual(len(response.json()['results']), 5)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_not_modified(self):
+        url = reverse('api_posts')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 0)
+
+        Post.objects.create(author=self.user, text='Новый пост')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_if_modified_since(self):
+        url = reverse('api_group_posts', args=('cats',))
+        modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, 304)
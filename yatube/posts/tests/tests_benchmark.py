@@ -0,0 +1,38 @@
+import random
+
+from django.test import TestCase, override_settings
+
+from posts import benchmark
+from posts.models import Follow, Post, TimelineEntry, User
+
+
+@override_settings(TASK_QUEUE='sync')
+class TestBenchmarkCase(TestCase):
+    def setUp(self):
+        self.dataset = benchmark.seed(users=30, posts=120, groups=3,
+                                      comments=200, follows=5,
+                                      rng=random.Random(1))
+
+    def test_seed_is_power_law(self):
+        self.assertEqual(Post.objects.count(), 120)
+        followers = sorted(
+            User.objects.values_list('counters__followers', flat=True))
+        # у самого популярного автора намного больше подписчиков, чем
+        # у типичного
+        self.assertGreater(followers[-1], 3 * followers[len(followers) // 2])
+        self.assertEqual(self.dataset['follows'], Follow.objects.count())
+        self.assertTrue(TimelineEntry.objects.exists())
+
+    def test_seed_dates_are_distinct(self):
+        dates = Post.objects.values_list('pub_date', flat=True)
+        self.assertEqual(len(set(dates)), 120)
+
+    def test_run(self):
+        results = benchmark.run(requests=3, warmup=1,
+                                only=['index', 'post_detail', 'add_comment'])
+        self.assertEqual(set(results),
+                         {'index', 'post_detail', 'add_comment'})
+        for result in results.values():
+            self.assertEqual(result['requests'], 3)
+            self.assertGreater(result['queries_avg'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
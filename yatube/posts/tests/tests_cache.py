@@ -1,48 +1,390 @@
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest.mock import patch
+
+from django.conf import settings
 from django.core.cache import cache
+from django.core.management import call_command
 from django.shortcuts import reverse
 from django.test import TestCase, override_settings
 
-from posts.models import Post, User
+from posts.cache import (LOCK_KEY, VERSION_KEY, cached, feed_cache_key,
+                         flush_stats, fragment_cache_key, get_versions,
+                         make_key, read_stats)
+from posts.models import Comment, Follow, Group, Post, User
+from posts.tests.utils import CommitCallbacksMixin, run_commit_callbacks
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
 
 
-class TestCachingPost(TestCase):
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestCachingPost(CommitCallbacksMixin, TestCase):
     def setUp(self):
         self.text = 'I love parking meters'
         self.user = User.objects.create(username='muzzy')
+        self.group = Group.objects.create(title='Gondoland', slug='gondoland')
         self.post = Post.objects.create(author=self.user,
-                                        text=self.text,)
+                                        text=self.text,
+                                        group=self.group)
         self.paths = (
             reverse('index'),
             reverse('profile', args=(self.user.username,)),
+            reverse('group_posts', args=(self.group.slug,)),
         )
         cache.clear()
 
-    @override_settings(
-        CACHES={
-            'default': {
-                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-            }
-        }
-    )
     def test_caching_text(self):
-        cache.clear()
         self.assertContains(self.client.get(reverse('index')), self.text)
+        # update() не шлет сигналов, поэтому видна закешированная страница
+        Post.objects.update(text='SOME_ANOTHER_TEXT')
+        self.assertContains(self.client.get(reverse('index')), self.text)
+
+    def test_edit_post_invalidates_pages(self):
+        for path in self.paths:
+            self.client.get(path)
         self.post.text = 'SOME_ANOTHER_TEXT'
         self.post.save()
-        self.assertContains(self.client.get(reverse('index')), self.text)
+        for path in self.paths:
+            with self.subTest(path=path):
+                self.assertContains(self.client.get(path),
+                                    'SOME_ANOTHER_TEXT')
 
     def test_new_post_is_on_index(self):
         text = 'SOME_ANOTHER_TEXT'
-        cache.clear()
-        with self.settings(CACHES={
-            'default': {
-                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
-            self.client.get(reverse('index'))
-            self.client.force_login(self.user)
-            self.client.post(reverse('new_post'), {'text': text}, follow=True)
-            response_index = self.client.get(reverse('index'))
-            self.assertNotContains(response_index, text)
+        self.client.get(reverse('index'))
+        self.client.force_login(self.user)
+        self.client.post(reverse('new_post'), {'text': text}, follow=True)
+        response_index = self.client.get(reverse('index'))
+        self.assertContains(response_index, text)
+
+    def test_move_post_to_another_group(self):
+        other = Group.objects.create(title='Neverland', slug='neverland')
+        old_path = reverse('group_posts', args=(self.group.slug,))
+        self.client.get(old_path)
+        self.post.group = other
+        self.post.save()
+        self.assertNotContains(self.client.get(old_path), self.text)
+
+    def test_comment_invalidates_index(self):
+        self.client.get(reverse('index'))
+        Comment.objects.create(post=self.post, author=self.user, text='hi')
+        self.assertContains(self.client.get(reverse('index')), '1 комментарий')
+
+    def test_group_rename_invalidates_profile(self):
+        path = reverse('profile', args=(self.user.username,))
+        self.client.get(path)
+        self.group.title = 'Renamed'
+        self.group.save()
+        self.assertContains(self.client.get(path), 'Renamed')
+
+    def test_follow_invalidates_follow_index(self):
+        reader = User.objects.create(username='reader')
+        self.client.force_login(reader)
+        self.assertNotContains(self.client.get(reverse('follow_index')),
+                               self.text)
+        Follow.objects.create(user=reader, author=self.user)
+        self.assertContains(self.client.get(reverse('follow_index')),
+                            self.text)
+
+    def test_pages_not_shared_between_users(self):
+        self.client.get(reverse('index'))
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(reverse('index')),
+                            'Пользователь: muzzy')
+
+    def test_versions_change_after_commit(self):
+        # до коммита запрос видит старые строки: версия должна быть старой
+        before = get_versions(['posts'])
+        Post.objects.create(author=self.user, text='NEW')
+        self.assertEqual(get_versions(['posts']), before)
+        run_commit_callbacks()
+        self.assertNotEqual(get_versions(['posts']), before)
 
     def test_header(self):
         response = self.client.get(reverse('index'))
         self.assertTrue(response.has_header('Cache-Control'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestFeedFragmentCache(CommitCallbacksMixin, TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='muzzy')
+        self.reader = User.objects.create(username='bob')
+        self.group = Group.objects.create(title='Gondoland', slug='gondoland')
+        self.other = Group.objects.create(title='Neverland', slug='neverland')
+        Post.objects.create(author=self.author, text='GONDOLAND_POST',
+                            group=self.group)
+        Post.objects.create(author=self.author, text='NEVERLAND_POST',
+                            group=self.other)
+        cache.clear()
+
+    def test_fragment_not_shared_between_groups(self):
+        self.client.get(reverse('group_posts', args=(self.group.slug,)))
+        response = self.client.get(
+            reverse('group_posts', args=(self.other.slug,)))
+        self.assertContains(response, 'NEVERLAND_POST')
+        self.assertNotContains(response, 'GONDOLAND_POST')
+
+    def test_key_depends_on_scope(self):
+        # версии разных scopes могут совпасть: ключи все равно разные
+        cache.set_many({VERSION_KEY.format('posts'): 1,
+                        VERSION_KEY.format('group:gondoland'): 1})
+        self.assertNotEqual(fragment_cache_key('posts', []),
+                            fragment_cache_key('group:gondoland', []))
+
+    def test_author_edit_link_not_leaked_to_reader(self):
+        path = reverse('group_posts', args=(self.group.slug,))
+        self.client.force_login(self.author)
+        self.assertContains(self.client.get(path), 'Редактировать')
+        self.client.force_login(self.reader)
+        self.assertNotContains(self.client.get(path), 'Редактировать')
+
+    def test_fragment_shared_between_readers(self):
+        path = reverse('group_posts', args=(self.group.slug,))
+        self.client.force_login(self.reader)
+        self.client.get(path)
+        # update() не шлет сигналов: другой читатель видит фрагмент из кеша
+        Post.objects.update(text='CHANGED')
+        self.client.force_login(
+            User.objects.create(username='corvex'))
+        self.assertContains(self.client.get(path), 'GONDOLAND_POST')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestConditionalGet(CommitCallbacksMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='muzzy')
+        self.reader = User.objects.create(username='sylvia')
+        self.group = Group.objects.create(title='Gondoland', slug='gondoland')
+        self.post = Post.objects.create(author=self.user, text='Hello',
+                                        group=self.group)
+        self.paths = (
+            reverse('index'),
+            reverse('profile', args=(self.user.username,)),
+            reverse('group_posts', args=(self.group.slug,)),
+            reverse('post_view', args=(self.user.username, self.post.pk)),
+        )
+
+    def test_not_modified(self):
+        for path in self.paths:
+            response = self.client.get(path)
+            self.assertIn('Cookie', response['Vary'])
+            self.assertIn('public', response['Cache-Control'])
+            self.assertTrue(response.has_header('Last-Modified'))
+            response = self.client.get(
+                path, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304, path)
+
+    def test_changes_are_revalidated(self):
+        path = reverse('post_view', args=(self.user.username, self.post.pk))
+        etag = self.client.get(path)['ETag']
+        Comment.objects.create(author=self.reader, post=self.post,
+                               text='Nice')
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Nice')
+
+    def test_etag_is_per_user(self):
+        path = reverse('profile', args=(self.user.username,))
+        etag = self.client.get(path)['ETag']
+        self.client.force_login(self.reader)
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        Follow.objects.follow(self.reader, self.user)
+        self.assertNotEqual(self.client.get(path)['ETag'], response['ETag'])
+
+    def test_etag_changes_with_new_login(self):
+        self.reader.set_password('secret')
+        self.reader.save()
+        credentials = {'username': 'sylvia', 'password': 'secret'}
+        path = reverse('post_view', args=(self.user.username, self.post.pk))
+        self.client.post(reverse('login'), credentials)
+        etag = self.client.get(path)['ETag']
+        self.client.get(reverse('logout'))
+        self.client.post(reverse('login'), credentials)
+        # CSRF-токен в форме комментария от прошлого входа уже не годен
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestUserFragments(CommitCallbacksMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='muzzy')
+        self.reader = User.objects.create(username='bob')
+        self.post = Post.objects.create(author=self.author, text='ORIGINAL')
+        self.paths = (
+            reverse('index'),
+            reverse('profile', args=(self.author.username,)),
+            reverse('post_view', args=(self.author.username, self.post.pk)),
+        )
+
+    def test_skeleton_shared_between_users(self):
+        for path in self.paths:
+            self.client.force_login(self.reader)
+            self.client.get(path)
+            # update() не шлет сигналов: ответ ниже собран из кеша
+            Post.objects.update(text='CHANGED')
+            self.client.force_login(self.author)
+            response = self.client.get(path)
+            self.assertContains(response, 'ORIGINAL')
+            self.assertContains(response, 'Пользователь: muzzy')
+            self.assertContains(response, 'Редактировать')
+            self.assertNotContains(response, '<!--user-fragment')
+            Post.objects.update(text='ORIGINAL')
+
+    def test_anonymous_skeleton_filled_for_user(self):
+        path = reverse('post_view', args=(self.author.username, self.post.pk))
+        response = self.client.get(path)
+        self.assertNotContains(response, 'csrfmiddlewaretoken')
+        self.assertContains(response, 'Войти')
+        self.client.force_login(self.reader)
+        response = self.client.get(path)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertContains(response, 'Подписаться')
+        self.assertNotContains(response, 'Редактировать')
+
+    def test_follow_button_is_personal(self):
+        Follow.objects.follow(self.reader, self.author)
+        path = reverse('profile', args=(self.author.username,))
+        self.client.get(path)
+        self.client.force_login(self.reader)
+        self.assertContains(self.client.get(path), 'Отписаться')
+        self.client.force_login(self.author)
+        response = self.client.get(path)
+        self.assertNotContains(response, 'Отписаться')
+        self.assertNotContains(response, 'Подписаться')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestStampedeProtection(CommitCallbacksMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.computed = 0
+
+    def compute(self):
+        self.computed += 1
+        return f'value {self.computed}'
+
+    def test_miss_computes_and_releases_lock(self):
+        self.assertEqual(cached('key', self.compute, 60, stale_key='stale'),
+                         ('value 1', True))
+        self.assertEqual(cache.get('stale'), 'value 1')
+        self.assertIsNone(cache.get(LOCK_KEY.format('key')))
+        self.assertEqual(cached('key', self.compute, 60), ('value 1', True))
+        self.assertEqual(self.computed, 1)
+
+    def test_locked_miss_serves_stale(self):
+        cache.set('stale', 'old')
+        cache.add(LOCK_KEY.format('key'), 1)
+        self.assertEqual(cached('key', self.compute, 60, stale_key='stale'),
+                         ('old', False))
+        self.assertEqual(self.computed, 0)
+
+    @override_settings(FEED_CACHE_LOCK_WAIT=0)
+    def test_locked_miss_without_stale_computes(self):
+        cache.add(LOCK_KEY.format('key'), 1)
+        self.assertEqual(cached('key', self.compute, 60), ('value 1', True))
+
+    @patch('posts.cache.random.random', return_value=0.5)
+    def test_early_recompute_near_expiry(self, _):
+        # считалось 10 секунд, до срока 1 секунда: пора пересчитать
+        cache.set('key', ('old', 10, time.time() + 1))
+        self.assertEqual(cached('key', self.compute, 60), ('value 1', True))
+        # до срока час: пересчет не нужен
+        cache.set('key', ('old', 0.01, time.time() + 3600))
+        self.assertEqual(cached('key', self.compute, 60), ('old', True))
+
+    def test_early_recompute_keeps_serving_while_locked(self):
+        cache.set('key', ('old', 10, time.time() + 1))
+        cache.add(LOCK_KEY.format('key'), 1)
+        self.assertEqual(cached('key', self.compute, 60), ('old', True))
+        self.assertEqual(self.computed, 0)
+
+    def test_single_flight_between_threads(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return self.compute()
+
+        results = []
+        leader = threading.Thread(
+            target=lambda: results.append(cached('key', slow, 60)))
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(
+            target=lambda: results.append(cached('key', self.compute, 60)))
+        follower.start()
+        release.set()
+        leader.join(5)
+        follower.join(5)
+        self.assertEqual(results, [('value 1', True)] * 2)
+        self.assertEqual(self.computed, 1)
+
+    def test_stale_page_has_no_validators(self):
+        user = User.objects.create(username='muzzy')
+        Post.objects.create(author=user, text='ORIGINAL')
+        self.client.get(reverse('index'))
+        Post.objects.create(author=user, text='NEW')
+        key = feed_cache_key(self.client.get(reverse('index')).wsgi_request,
+                             ['posts'])
+        cache.delete(key)
+        cache.add(LOCK_KEY.format(key), 1)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'NEW')
+        self.assertFalse(response.has_header('ETag'))
+
+
+class TestSharedCacheConfig(CommitCallbacksMixin, TestCase):
+    def test_long_keys_are_hashed(self):
+        key = make_key('feed_page:1:all:/?q=' + 'x' * 300, 'yatube', 1)
+        self.assertTrue(key.startswith('yatube:1:'))
+        self.assertLessEqual(len(key), 250)
+        self.assertNotIn(' ', make_key('a b', 'yatube', 1))
+        self.assertEqual(make_key('posts', 'yatube', 2), 'yatube:2:posts')
+
+    def test_file_cache_shared_between_processes(self):
+        with tempfile.TemporaryDirectory() as location:
+            caches = {'default': {
+                'BACKEND': settings.CACHE_BACKENDS['file'],
+                'LOCATION': location,
+                'KEY_PREFIX': 'yatube',
+                'KEY_FUNCTION': 'posts.cache.make_key',
+            }}
+            with override_settings(CACHES=caches):
+                user = User.objects.create(username='muzzy')
+                Post.objects.create(author=user, text='ORIGINAL')
+                self.client.get(reverse('index'))
+                Post.objects.update(text='CHANGED')
+                self.assertContains(self.client.get(reverse('index')),
+                                    'ORIGINAL')
+                Post.objects.create(author=user, text='NEW')
+                self.assertContains(self.client.get(reverse('index')),
+                                    'CHANGED')
+
+    @override_settings(CACHES=LOCMEM_CACHES, CACHE_STATS_FLUSH_EVERY=1)
+    def test_hit_miss_stats(self):
+        # счетчики, накопленные в процессе другими тестами
+        flush_stats()
+        cache.clear()
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        hits, misses = read_stats()['page']
+        self.assertEqual((hits, misses), (1, 1))
+        out = StringIO()
+        call_command('cache_stats', '--reset', stdout=out)
+        self.assertIn('page: попаданий 1, промахов 1, доля 50.0%',
+                      out.getvalue())
+        self.assertEqual(read_stats()['page'], (0, 0))
@@ -1,5 +1,7 @@
+from django.db import connection
 from django.shortcuts import reverse
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from posts.models import Comment, Post, User
 
@@ -41,3 +43,45 @@ class TestGetCommentInPage(TestCase):
 
     def test_get_comment_on_postpage(self):
         self.assertContains(self.client.get(self.path), self.comment)
+
+
+class TestCommentsPagination(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='alice')
+        self.post = Post.objects.create(author=self.user, text='text')
+        Comment.objects.bulk_create(
+            Comment(author=self.user, post=self.post, text=f'comment {i}')
+            for i in range(25))
+        self.kwargs = {'username': self.user.username,
+                       'post_id': self.post.id}
+
+    def test_post_page_shows_first_comments_page(self):
+        response = self.client.get(reverse('post_view', kwargs=self.kwargs))
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 20)
+        self.assertTrue(comments.has_next())
+        self.assertContains(response, 'Показать еще')
+
+    def test_fragment_returns_rest_of_comments(self):
+        response = self.client.get(reverse('post_view', kwargs=self.kwargs))
+        next_url = response.context['comments'].next_page_url()
+        fragment = self.client.get(
+            reverse('post_comments', kwargs=self.kwargs) + next_url)
+        self.assertEqual(len(fragment.context['comments']), 5)
+        self.assertNotContains(fragment, 'Показать еще')
+        self.assertNotContains(fragment, '<html')
+        shown = {comment.pk for comment in response.context['comments']}
+        more = {comment.pk for comment in fragment.context['comments']}
+        self.assertEqual(len(shown | more), 25)
+
+    def test_post_page_queries_not_depend_on_comments(self):
+        path = reverse('post_view', kwargs=self.kwargs)
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(path)
+        users = [User.objects.create(username=f'user{i}') for i in range(5)]
+        Comment.objects.bulk_create(
+            Comment(author=user, post=self.post, text='more')
+            for user in users)
+        with CaptureQueriesContext(connection) as after:
+            self.client.get(path)
+        self.assertEqual(len(after), len(before))
@@ -0,0 +1,96 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.shortcuts import reverse
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from posts import counters
+from posts.models import Comment, Follow, Post, User, UserCounters
+
+
+class TestCounters(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create(username='alice')
+        self.bob = User.objects.create(username='bob')
+
+    def counters(self, user):
+        return UserCounters.objects.get(user=user)
+
+    def test_counters_created_with_user(self):
+        counters = self.counters(self.alice)
+        self.assertEqual(
+            (counters.followers, counters.following, counters.posts),
+            (0, 0, 0))
+
+    def test_follow_and_unfollow_through_views(self):
+        self.client.force_login(self.bob)
+        self.client.get(reverse('profile_follow', args=(self.alice.username,)))
+        self.assertEqual(self.counters(self.alice).followers, 1)
+        self.assertEqual(self.counters(self.bob).following, 1)
+        self.client.get(
+            reverse('profile_unfollow', args=(self.alice.username,)))
+        self.assertEqual(self.counters(self.alice).followers, 0)
+        self.assertEqual(self.counters(self.bob).following, 0)
+
+    def test_follow_manager_switch(self):
+        self.alice.following.switch(self.bob)
+        self.assertEqual(self.counters(self.alice).followers, 1)
+        self.alice.following.switch(self.bob)
+        self.assertEqual(self.counters(self.alice).followers, 0)
+
+    def test_posts_and_comments(self):
+        post = Post.objects.create(author=self.alice, text='text')
+        Comment.objects.create(post=post, author=self.bob, text='hi')
+        comment = Comment.objects.create(post=post, author=self.bob, text='!')
+        self.assertEqual(self.counters(self.alice).posts, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        post.delete()
+        self.assertEqual(self.counters(self.alice).posts, 0)
+
+    def test_repeated_tasks_do_not_drift(self):
+        post = Post.objects.create(author=self.alice, text='text')
+        Comment.objects.create(post=post, author=self.bob, text='hi')
+        # повтор задачи после сбоя не должен прибавлять еще раз
+        counters.refresh(self.alice.pk, 'posts')
+        counters.refresh_comments(post.pk)
+        post.refresh_from_db()
+        self.assertEqual(self.counters(self.alice).posts, 1)
+        self.assertEqual(post.comments_count, 1)
+
+    def test_delete_user_with_posts_and_follows(self):
+        corvex = User.objects.create(username='corvex')
+        post = Post.objects.create(author=self.alice, text='text')
+        Comment.objects.create(post=post, author=self.bob, text='hi')
+        Follow.objects.create(user=self.bob, author=self.alice)
+        Follow.objects.create(user=self.alice, author=corvex)
+        alice_id = self.alice.pk
+        self.alice.delete()
+        self.assertFalse(UserCounters.objects.filter(
+            user_id=alice_id).exists())
+        self.assertEqual(self.counters(self.bob).following, 0)
+        self.assertEqual(self.counters(corvex).followers, 0)
+
+    def test_recount_command(self):
+        Follow.objects.create(user=self.bob, author=self.alice)
+        post = Post.objects.create(author=self.alice, text='text')
+        Comment.objects.create(post=post, author=self.bob, text='hi')
+        UserCounters.objects.update(followers=42, following=42, posts=42)
+        Post.objects.update(comments_count=42)
+        UserCounters.objects.filter(user=self.bob).delete()
+        call_command('recount_counters', stdout=StringIO())
+        alice, bob = self.counters(self.alice), self.counters(self.bob)
+        self.assertEqual((alice.followers, alice.posts), (1, 1))
+        self.assertEqual((bob.following, bob.posts), (1, 0))
+        self.assertEqual(Post.objects.get().comments_count, 1)
+
+    def test_profile_without_count_queries(self):
+        Follow.objects.create(user=self.bob, author=self.alice)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('profile', args=(self.alice.username,)))
+        self.assertContains(response, 'Подписчиков: 1')
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
@@ -0,0 +1,79 @@
+import io
+import os
+import random
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from posts import benchmark, dump, search
+from posts.models import Comment, Follow, Group, Post, TimelineEntry, User
+
+
+@override_settings(TASK_QUEUE='sync')
+class TestDumpCase(TestCase):
+    def setUp(self):
+        benchmark.seed(users=10, posts=40, groups=2, comments=30, follows=3,
+                       rng=random.Random(2))
+
+    def snapshot(self):
+        return {
+            'users': list(User.objects.order_by('pk').values_list(
+                'pk', 'username', 'password')),
+            'groups': list(Group.objects.order_by('pk').values_list(
+                'pk', 'slug')),
+            'posts': list(Post.objects.order_by('pk').values_list(
+                'pk', 'text', 'pub_date', 'author', 'group')),
+            'comments': list(Comment.objects.order_by('pk').values_list(
+                'pk', 'post', 'author', 'created')),
+            'follows': sorted(Follow.objects.values_list('user', 'author')),
+        }
+
+    def wipe(self):
+        for model in (Follow, Comment, Post, Group, User):
+            model.objects.all().delete()
+
+    def test_round_trip(self):
+        before = self.snapshot()
+        counters = list(User.objects.order_by('pk').values_list(
+            'counters__posts', 'counters__followers'))
+        stream = io.StringIO()
+        totals = dump.export(stream)
+        self.assertEqual(totals['posts.post'], 40)
+        self.assertEqual(len(stream.getvalue().splitlines()),
+                         sum(totals.values()))
+
+        self.wipe()
+        stream.seek(0)
+        loaded = dump.load(stream, batch_size=7)
+        dump.rebuild_derived()
+
+        self.assertEqual(loaded, totals)
+        # даты из файла, а не время загрузки
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(counters, list(User.objects.order_by(
+            'pk').values_list('counters__posts', 'counters__followers')))
+        self.assertTrue(TimelineEntry.objects.exists())
+        self.assertTrue(search.search_ids('котиков', 'post', 5))
+        # счетчик id не отстал от загруженных строк
+        user = User.objects.create(username='after_import')
+        self.assertGreater(user.pk, before['users'][-1][0])
+
+    def test_ignore_conflicts(self):
+        stream = io.StringIO()
+        dump.export(stream, labels=['posts.group'])
+        stream.seek(0)
+        dump.load(stream, ignore_conflicts=True)
+        self.assertEqual(Group.objects.count(), 2)
+
+    def test_commands_with_gzip(self):
+        before = self.snapshot()
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'dump.ndjson.gz')
+            call_command('export_ndjson', path, stderr=io.StringIO())
+            self.wipe()
+            out = io.StringIO()
+            call_command('import_ndjson', path, stdout=out,
+                         stderr=io.StringIO())
+        self.assertIn('Загружено объектов', out.getvalue())
+        self.assertEqual(self.snapshot(), before)
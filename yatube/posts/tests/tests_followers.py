@@ -1,7 +1,14 @@
+from io import StringIO
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from django.db import connection
 from django.shortcuts import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
-from posts.models import Follow, Post, User
+from posts.models import Follow, Post, TimelineEntry, User, UserCounters
+from posts.timeline import TimelinePaginator
 
 
 class TestFollowingCase(TestCase):
@@ -61,3 +68,168 @@ class TestFollowingCase(TestCase):
         self.client.get(reverse('profile_follow',
                                 args={self.corvex.username}))
         self.assertEqual(self.corvex.follower.count(), 0)
+
+
+class TestTimelineCase(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create(username='alice')
+        self.bob = User.objects.create(username='bob')
+        Follow.objects.create(user=self.bob, author=self.alice)
+
+    def follow_page_posts(self):
+        self.client.force_login(self.bob)
+        response = self.client.get(reverse('follow_index'))
+        return [post.text for post in response.context['page']]
+
+    def test_new_post_fanned_out(self):
+        post = Post.objects.create(author=self.alice, text='fresh')
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.bob, post=post).exists())
+
+    def test_follow_backfills_old_posts(self):
+        corvex = User.objects.create(username='corvex')
+        Post.objects.create(author=corvex, text='old')
+        Follow.objects.create(user=self.bob, author=corvex)
+        self.assertEqual(self.follow_page_posts(), ['old'])
+
+    @override_settings(TIMELINE_LENGTH=2)
+    def test_timeline_is_bounded(self):
+        for i in range(4):
+            Post.objects.create(author=self.alice, text=f'post {i}')
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.bob).count(), 2)
+
+    def test_pages_merge_timeline_and_celebrities(self):
+        corvex = User.objects.create(username='corvex')
+        Follow.objects.create(user=self.bob, author=corvex)
+        # вторая подписчица делает alice «звездой» при лимите 1
+        Follow.objects.create(user=corvex, author=self.alice)
+        with override_settings(TIMELINE_FANOUT_LIMIT=1):
+            for i in range(5):
+                Post.objects.create(author=self.alice, text=f'star {i}')
+                Post.objects.create(author=corvex, text=f'plain {i}')
+            paginator = TimelinePaginator(self.bob, 3)
+            texts, cursor = [], None
+            while True:
+                page = paginator.get_page(before=cursor)
+                texts += [post.text for post in page]
+                if not page.has_next():
+                    break
+                cursor = page.cursor(page.object_list[-1])
+        self.assertFalse(TimelineEntry.objects.filter(
+            post__author=self.alice).exists())
+        expected = Post.objects.filter(
+            author__in=[self.alice, corvex]).order_by(
+            '-pub_date', '-pk').values_list('text', flat=True)
+        self.assertEqual(texts, list(expected))
+        self.assertEqual(len(texts), 10)
+
+    @override_settings(TIMELINE_LENGTH=3, TIMELINE_FANOUT_LIMIT=1)
+    def test_rebuild_matches_fan_out(self):
+        corvex = User.objects.create(username='corvex')
+        star = User.objects.create(username='star')
+        Follow.objects.create(user=self.bob, author=corvex)
+        Follow.objects.create(user=self.bob, author=star)
+        Follow.objects.create(user=corvex, author=star)
+        for i in range(3):
+            for author in (self.alice, corvex, star):
+                Post.objects.create(author=author, text=f'{author} {i}')
+        entries = set(TimelineEntry.objects.values_list('user', 'post'))
+        out = StringIO()
+        call_command('rebuild_timelines', stdout=out)
+        self.assertEqual(
+            set(TimelineEntry.objects.values_list('user', 'post')), entries)
+        self.assertIn(f'Записей в лентах: {len(entries)}', out.getvalue())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=2)
+    def test_celebrity_keeps_posts_after_losing_followers(self):
+        fans = [User.objects.create(username=f'fan{i}') for i in range(2)]
+        for fan in fans:
+            Follow.objects.create(user=fan, author=self.alice)
+        Post.objects.create(author=self.alice, text='star post')
+        late = User.objects.create(username='late')
+        Follow.objects.create(user=late, author=self.alice)
+        Follow.objects.filter(user=fans[0]).delete()
+        Follow.objects.filter(user=fans[1]).delete()
+        self.assertEqual(self.follow_page_posts(), ['star post'])
+        self.assertEqual(
+            [post.text for post in TimelinePaginator(late, 10).get_page()],
+            ['star post'])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_celebrity_posts_read_on_request(self):
+        Post.objects.create(author=self.alice, text='star post')
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.follow_page_posts(), ['star post'])
+
+
+class TestAtomicFollowCase(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create(username='alice')
+        self.bob = User.objects.create(username='bob')
+
+    def test_follow_returns_state_and_is_idempotent(self):
+        self.assertTrue(Follow.objects.follow(self.bob, self.alice))
+        self.assertTrue(Follow.objects.follow(self.bob, self.alice))
+        self.assertEqual(self.bob.follower.count(), 1)
+        self.assertEqual(
+            UserCounters.objects.get(user=self.alice).followers, 1)
+
+    def test_follow_self_is_refused(self):
+        self.assertFalse(Follow.objects.follow(self.bob, self.bob))
+        self.assertFalse(Follow.objects.exists())
+
+    def test_toggle(self):
+        self.assertTrue(Follow.objects.toggle(self.bob, self.alice))
+        self.assertFalse(Follow.objects.toggle(self.bob, self.alice))
+        self.assertFalse(Follow.objects.exists())
+
+    def test_follow_starts_with_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            Follow.objects.follow(self.bob, self.alice)
+        follow_queries = [query['sql'] for query in queries
+                          if 'posts_follow' in query['sql']]
+        self.assertTrue(follow_queries[0].startswith('INSERT'))
+
+    def test_switch_view(self):
+        self.client.force_login(self.bob)
+        path = reverse('profile_follow_switch', args=(self.alice.username,))
+        self.assertRedirects(
+            self.client.get(path),
+            reverse('profile', args=(self.alice.username,)))
+        self.assertEqual(self.bob.follower.count(), 1)
+        self.client.get(path)
+        self.assertEqual(self.bob.follower.count(), 0)
+
+
+class TestFollowedIdsCase(TestCase):
+    def setUp(self):
+        self.bob = User.objects.create(username='bob')
+        self.authors = [User.objects.create(username=f'author{i}')
+                        for i in range(5)]
+        for author in self.authors[:2]:
+            Follow.objects.create(user=self.bob, author=author)
+
+    def test_followed_ids_in_one_query(self):
+        with self.assertNumQueries(1):
+            followed = Follow.objects.followed_ids(self.bob, self.authors)
+        self.assertEqual(followed, {author.pk for author in self.authors[:2]})
+
+    def test_followed_ids_memoized(self):
+        Follow.objects.followed_ids(self.bob, self.authors)
+        with self.assertNumQueries(0):
+            Follow.objects.followed_ids(self.bob, self.authors[1:3])
+            self.assertTrue(Follow.objects.is_follow(self.authors[0],
+                                                     self.bob))
+
+    def test_memo_reset_after_unfollow(self):
+        author = self.authors[0]
+        self.assertTrue(Follow.objects.is_follow(author, self.bob))
+        Follow.objects.unfollow(self.bob, author)
+        self.assertFalse(Follow.objects.is_follow(author, self.bob))
+
+    def test_anonymous_follows_nobody(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                Follow.objects.followed_ids(AnonymousUser(), self.authors),
+                set())
@@ -0,0 +1,59 @@
+from django.shortcuts import reverse
+from django.test import TestCase, override_settings
+
+from posts.metrics import Histogram, registry
+from posts.models import Post, User
+
+
+class TestHistogramCase(TestCase):
+    def test_percentiles(self):
+        histogram = Histogram((1, 5, 10))
+        for value in (0.5, 2, 3, 4, 7, 100):
+            histogram.observe(value)
+        self.assertEqual(histogram.buckets, [1, 3, 1, 1])
+        self.assertEqual(histogram.percentile(0.5), 5)
+        self.assertEqual(histogram.percentile(0.95), float('inf'))
+
+
+class TestRequestMetricsCase(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.user = User.objects.create(username='alice', is_staff=True)
+        Post.objects.create(author=self.user, text='Hello')
+
+    def test_view_is_measured(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        stats = registry.snapshot()['index']
+        self.assertEqual(stats['requests'], 2)
+        self.assertGreater(stats['queries']['avg'], 0)
+        self.assertGreater(stats['template_ms']['avg'], 0)
+        self.assertEqual(stats['over_budget'], 0)
+
+    @override_settings(QUERY_BUDGETS={'index': 0})
+    def test_over_budget_is_logged(self):
+        with self.assertLogs('posts.metrics', 'WARNING') as logs:
+            self.client.get(reverse('index'))
+        self.assertIn('index', logs.output[0])
+        self.assertEqual(registry.snapshot()['index']['over_budget'], 1)
+
+    @override_settings(REQUEST_METRICS_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('index'))
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+    @override_settings(REQUEST_METRICS_LOG_EVERY=2)
+    def test_summary_log_line(self):
+        with self.assertLogs('posts.metrics', 'INFO') as logs:
+            self.client.get(reverse('index'))
+            self.client.get(reverse('index'))
+        self.assertIn('"index"', logs.output[-1])
+
+    @override_settings(INTERNAL_IPS=['127.0.0.1'])
+    def test_endpoint_is_for_staff(self):
+        self.client.get(reverse('index'))
+        path = reverse('request_metrics')
+        self.assertEqual(self.client.get(path).status_code, 404)
+        self.client.force_login(self.user)
+        response = self.client.get(path)
+        self.assertIn('index', response.json()['views'])
@@ -0,0 +1,94 @@
+import base64
+
+from django.db import connection
+from django.shortcuts import reverse
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from posts.models import Post, User
+from posts.paginator import CursorPaginator, decode_cursor, encode_cursor
+
+
+class TestCursorPaginator(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='muzzy')
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'post {i}') for i in range(25))
+        # одинаковая дата публикации проверяет разбор ничьих по id
+        Post.objects.update(pub_date=timezone.now())
+        self.paginator = CursorPaginator(Post.objects.feed(), 10)
+
+    def walk(self):
+        page = self.paginator.get_page()
+        pages = [page]
+        while page.has_next():
+            last = page.object_list[-1]
+            page = self.paginator.get_page(before=encode_cursor(last),
+                                           number=page.number + 1)
+            pages.append(page)
+        return pages
+
+    def test_walk_all_pages_without_duplicates(self):
+        pages = self.walk()
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual([page.number for page in pages], [1, 2, 3])
+        ids = [post.pk for page in pages for post in page]
+        self.assertEqual(len(set(ids)), 25)
+        self.assertEqual(
+            ids, list(Post.objects.order_by('-pub_date', '-pk')
+                      .values_list('pk', flat=True)))
+
+    def test_previous_page_by_after_cursor(self):
+        second, third = self.walk()[1:]
+        first_on_third = third.object_list[0]
+        page = self.paginator.get_page(after=encode_cursor(first_on_third),
+                                       number=2)
+        self.assertEqual(list(page), list(second))
+        self.assertTrue(page.has_previous())
+        self.assertTrue(page.has_next())
+
+    def test_skip_inside_window(self):
+        first, _, third = self.walk()
+        page = self.paginator.get_page(
+            before=encode_cursor(first.object_list[-1]), skip=10, number=3)
+        self.assertEqual(list(page), list(third))
+        self.assertEqual(page.number, 3)
+
+    def test_broken_cursor_gives_first_page(self):
+        page = self.paginator.get_page(before='not-a-cursor')
+        self.assertEqual(page.number, 1)
+        self.assertFalse(page.has_previous())
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+
+    def test_out_of_range_cursor_is_broken(self):
+        def cursor(raw):
+            return base64.urlsafe_b64encode(raw.encode()).decode()
+
+        huge = cursor('2020-01-01T00:00:00+00:00|' + '9' * 30)
+        self.assertIsNone(decode_cursor(huge))
+        self.assertIsNone(decode_cursor(cursor('2020-01-01T00:00:00|1')))
+        response = self.client.get(reverse('index'), {'before': huge})
+        self.assertEqual(response.status_code, 200)
+
+    def test_window_is_bounded(self):
+        page = self.walk()[1]
+        numbers = [item['number'] for item in page.window]
+        self.assertEqual(numbers, [1, 2, 3])
+
+    def test_deep_page_costs_same_queries(self):
+        first, second, _ = self.walk()
+        with CaptureQueriesContext(connection) as first_queries:
+            self.client.get(reverse('index'))
+        with CaptureQueriesContext(connection) as deep_queries:
+            self.client.get(second.next_page_url())
+        self.assertNotIn('OFFSET', ' '.join(
+            query['sql'] for query in first_queries))
+        self.assertLessEqual(len(deep_queries), len(first_queries) + 1)
+        self.assertEqual(len(first), 10)
+
+    def test_index_renders_next_link(self):
+        response = self.client.get(reverse('index'))
+        page = response.context['page']
+        next_url = page.next_page_url().replace('&', '&amp;')
+        self.assertContains(response, next_url)
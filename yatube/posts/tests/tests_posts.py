@@ -1,5 +1,7 @@
+from django.db import connection
 from django.shortcuts import reverse
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from posts.models import Group, Post, User
 
@@ -158,3 +160,35 @@ class TestGetPostInPages(TestCase):
         for path in self.paths:
             with self.subTest(path=path):
                 self.assertContains(self.client.get(path), self.img_tag)
+
+
+class TestFeedQueries(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='muzzy')
+        self.group = Group.objects.create(title='Gondoland', slug='gondoland')
+        self.paths = (
+            reverse('index'),
+            reverse('profile', args=(self.user.username,)),
+            reverse('group_posts', args=(self.group.slug,)),
+        )
+
+    def count_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(path)
+        return len(queries)
+
+    def test_feed_queries_not_depend_on_posts_count(self):
+        Post.objects.create(author=self.user, text='first', group=self.group)
+        single = {path: self.count_queries(path) for path in self.paths}
+        for i in range(9):
+            Post.objects.create(author=self.user, text=f'post {i}',
+                                group=self.group)
+        for path in self.paths:
+            with self.subTest(path=path):
+                self.assertEqual(self.count_queries(path), single[path])
+
+    def test_feed_comments_count_annotation(self):
+        post = Post.objects.create(author=self.user, text='first')
+        post.comments.create(author=self.user, text='comment')
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, '1 комментарий')
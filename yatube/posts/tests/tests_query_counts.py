@@ -0,0 +1,92 @@
+from django.shortcuts import reverse
+from django.test import TestCase
+
+from posts.models import Comment, Follow, Group, Post, User
+from posts.tests.utils import QueryCountMixin
+
+
+class TestQueryCountsCase(QueryCountMixin, TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='alice')
+        self.reader = User.objects.create(username='bob')
+        self.group = Group.objects.create(title='Котики', slug='cats')
+        self.post = Post.objects.create(author=self.author, text='Первый',
+                                        group=self.group)
+        Follow.objects.follow(self.reader, self.author)
+        self.client.force_login(self.reader)
+
+    def grow_posts(self, size):
+        """ Посты разных авторов (и разных групп) в ленте """
+        for i in range(Post.objects.count(), size):
+            author = User.objects.create(username=f'author{i}')
+            group = Group.objects.create(title=f'g{i}', slug=f'g{i}')
+            Post.objects.create(author=author, text=f'Пост {i}', group=group)
+            Follow.objects.follow(self.reader, author)
+            Comment.objects.create(author=author, post=self.post,
+                                   text=f'Комментарий {i}')
+
+    def grow_own_posts(self, size):
+        """ Посты одного автора в одной группе """
+        for i in range(self.author.posts.count(), size):
+            Post.objects.create(author=self.author, text=f'Пост {i}',
+                                group=self.group)
+
+    def grow_comments(self, size):
+        for i in range(self.post.comments.count(), size):
+            commentator = User.objects.create(username=f'reader{i}')
+            Comment.objects.create(author=commentator, post=self.post,
+                                   text=f'Комментарий {i}')
+
+    def grow_followers(self, size):
+        for i in range(self.author.following.count(), size):
+            Follow.objects.follow(
+                User.objects.create(username=f'follower{i}'), self.author)
+
+    def test_index(self):
+        self.assertQueriesConstant(reverse('index'), self.grow_posts)
+
+    def test_follow_index(self):
+        self.assertQueriesConstant(reverse('follow_index'), self.grow_posts)
+
+    def test_group(self):
+        self.assertQueriesConstant(
+            reverse('group_posts', args=(self.group.slug,)),
+            self.grow_own_posts)
+
+    def test_profile(self):
+        self.assertQueriesConstant(
+            reverse('profile', args=(self.author.username,)),
+            self.grow_own_posts)
+
+    def test_post_detail(self):
+        self.assertQueriesConstant(
+            reverse('post_view', args=(self.author.username, self.post.pk)),
+            self.grow_comments)
+
+    def test_comments_fragment(self):
+        self.assertQueriesConstant(
+            reverse('post_comments',
+                    args=(self.author.username, self.post.pk)),
+            self.grow_comments)
+
+    def test_search(self):
+        self.assertQueriesConstant(reverse('search'), self.grow_posts,
+                                   data={'q': 'пост комментарий'})
+
+    def test_api(self):
+        paths = (
+            (reverse('api_posts'), self.grow_posts),
+            (reverse('api_follow'), self.grow_posts),
+            (reverse('api_groups'), self.grow_posts),
+            (reverse('api_group_posts', args=(self.group.slug,)),
+             self.grow_own_posts),
+            (reverse('api_user_posts', args=(self.author.username,)),
+             self.grow_own_posts),
+            (reverse('api_comments', args=(self.post.pk,)),
+             self.grow_comments),
+            (reverse('api_followers', args=(self.author.username,)),
+             self.grow_followers),
+        )
+        for path, grow in paths:
+            with self.subTest(path=path):
+                self.assertQueriesConstant(path, grow)
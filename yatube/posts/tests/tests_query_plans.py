@@ -0,0 +1,33 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from posts.models import Follow, Group, Post, User
+from posts.query_plans import check_feed_plans, plan_problems
+
+
+@skipUnless(connection.vendor == 'sqlite', 'планы проверяем на SQLite')
+class TestFeedQueryPlans(TestCase):
+    def setUp(self):
+        alice = User.objects.create(username='alice')
+        bob = User.objects.create(username='bob')
+        group = Group.objects.create(title='Gondoland', slug='gondoland')
+        Follow.objects.create(user=bob, author=alice)
+        Post.objects.create(author=alice, text='text', group=group)
+
+    def test_feed_queries_use_indexes(self):
+        self.assertEqual(check_feed_plans(), {})
+
+    def test_full_scan_detected(self):
+        queryset = Post.objects.order_by().filter(text__contains='text')
+        self.assertTrue(plan_problems(queryset))
+
+    def test_unbounded_index_walk_detected(self):
+        self.assertTrue(plan_problems(Post.objects.all()))
+        self.assertFalse(plan_problems(Post.objects.all()[:10]))
+
+    def test_unique_follow_constraint(self):
+        names = [
+            constraint.name for constraint in Follow._meta.constraints]
+        self.assertIn('unique_follow', names)
@@ -0,0 +1,82 @@
+import shutil
+import tempfile
+
+from django.db import connection
+from django.shortcuts import reverse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from posts.models import Post, Rendition, User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, TASK_QUEUE='sync')
+class TestRenditions(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = User.objects.create(username='muzzy')
+        self.client.force_login(self.user)
+
+    def create_post(self):
+        with open('posts/tests/photo.png', 'rb') as img:
+            self.client.post(reverse('new_post'),
+                             {'text': 'text', 'image': img})
+        return Post.objects.feed().get()
+
+    def test_renditions_created_on_new_post(self):
+        post = self.create_post()
+        picture = post.card_picture
+        img = picture['img']
+        self.assertEqual((img.width, img.height), (960, 339))
+        self.assertTrue(img.url.startswith('/media/renditions/'))
+        self.assertTrue(img.url.endswith('.png'))
+        widths = sorted(post.renditions.filter(
+            format=Rendition.ORIGINAL).values_list('width', flat=True))
+        self.assertEqual(widths, [320, 640, 960])
+        self.assertIn('320w', picture['srcset'])
+
+    def test_modern_formats_when_supported(self):
+        post = self.create_post()
+        types = [source['type'] for source in post.card_picture['sources']]
+        self.assertIn('image/webp', types)
+
+    @override_settings(POST_IMAGE_FORMATS=[])
+    def test_only_original_format(self):
+        post = self.create_post()
+        self.assertEqual(post.card_picture['sources'], [])
+
+    def test_same_image_stored_once(self):
+        first = self.create_post()
+        with open('posts/tests/photo.png', 'rb') as img:
+            self.client.post(reverse('new_post'),
+                             {'text': 'again', 'image': img})
+        second = Post.objects.exclude(pk=first.pk).get()
+        self.assertEqual(first.card_picture['img'].url,
+                         second.card_picture['img'].url)
+
+    def test_feed_uses_stored_renditions(self):
+        post = self.create_post()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, post.card_picture['img'].url)
+        self.assertContains(response, 'srcset=')
+        self.assertFalse(any('thumbnail_kvstore' in query['sql']
+                             for query in queries))
+
+    def test_rendition_dropped_with_image(self):
+        post = self.create_post()
+        self.client.post(
+            reverse('post_edit', args=(self.user.username, post.pk)),
+            {'text': 'text', 'image-clear': 'on'})
+        self.assertFalse(Rendition.objects.exists())
+
+    def test_post_without_rendition_shows_original(self):
+        post = Post.objects.create(author=self.user, text='text',
+                                   image='posts/photo.png')
+        self.assertContains(self.client.get(reverse('index')),
+                            f'src="{post.image.url}"')
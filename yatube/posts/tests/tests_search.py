@@ -0,0 +1,86 @@
+from django.core.management import call_command
+from django.db import connection
+from django.shortcuts import reverse
+from django.test import TestCase, override_settings
+
+from posts import search
+from posts.models import Comment, Post, User
+from posts.stemmer import stem
+
+
+class TestStemmerCase(TestCase):
+    def test_word_forms_share_stem(self):
+        self.assertEqual(stem('кошки'), stem('кошкам'))
+        self.assertEqual(stem('кошка'), stem('кошкой'))
+        self.assertEqual(stem('Мыслями'), stem('мысль'))
+
+    def test_latin_unchanged(self):
+        self.assertEqual(stem('django'), 'django')
+
+
+class TestSearchCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='alice')
+        self.cats = Post.objects.create(
+            author=self.user, text='Кошки любят спать на солнце')
+        self.dogs = Post.objects.create(
+            author=self.user, text='Собаки любят гулять')
+        self.comment = Comment.objects.create(
+            author=self.user, post=self.dogs, text='А моя кошка гуляет')
+
+    def test_word_forms_are_found(self):
+        self.assertEqual(search.search_ids('кошкам', search.POST, 10),
+                         [self.cats.pk])
+        self.assertEqual(search.search_ids('кошкой спать', search.POST, 10),
+                         [self.cats.pk])
+        self.assertEqual(search.search_ids('кошка', search.COMMENT, 10),
+                         [self.comment.pk])
+
+    def test_ranking(self):
+        many = Post.objects.create(
+            author=self.user, text='Любят, любят, очень любят')
+        ids = search.search_ids('любят', search.POST, 10)
+        self.assertEqual(ids[0], many.pk)
+        self.assertCountEqual(ids, [many.pk, self.cats.pk, self.dogs.pk])
+
+    def test_query_syntax_is_escaped(self):
+        for query in ['"', 'кошки OR', 'NEAR(', '*', '   ']:
+            search.search_ids(query, search.POST, 10)
+
+    def test_index_follows_changes(self):
+        self.cats.text = 'Про попугаев'
+        self.cats.save()
+        self.assertEqual(search.search_ids('кошки', search.POST, 10), [])
+        self.assertEqual(search.search_ids('попугай', search.POST, 10),
+                         [self.cats.pk])
+        self.dogs.delete()
+        self.assertEqual(search.search_ids('гулять', search.POST, 10), [])
+        self.assertEqual(search.search_ids('кошка', search.COMMENT, 10), [])
+
+    def test_rebuild_command(self):
+        if search.enabled():
+            with connection.cursor() as cursor:
+                cursor.execute('DELETE FROM posts_search')
+        call_command('rebuild_search_index', stdout=open('/dev/null', 'w'))
+        self.assertEqual(search.search_ids('собака', search.POST, 10),
+                         [self.dogs.pk])
+
+    def test_search_page(self):
+        response = self.client.get(reverse('search'), {'q': 'кошка'})
+        self.assertEqual(list(response.context['posts']), [self.cats])
+        self.assertEqual(list(response.context['comments']), [self.comment])
+        self.assertContains(response, self.cats.text)
+
+    @override_settings(SEARCH_MAX_PAGES=2)
+    def test_pages_are_limited(self):
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Котики номер {i}')
+            for i in range(35))
+        call_command('rebuild_search_index', stdout=open('/dev/null', 'w'))
+        response = self.client.get(reverse('search'), {'q': 'котик'})
+        self.assertTrue(response.context['has_next'])
+        response = self.client.get(reverse('search'),
+                                   {'q': 'котик', 'page': 5})
+        self.assertEqual(response.context['number'], 2)
+        self.assertFalse(response.context['has_next'])
+        self.assertEqual(len(response.context['posts']), 10)
@@ -0,0 +1,157 @@
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import OperationalError
+from django.shortcuts import reverse
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from posts import search, tasks
+from posts.models import Follow, Post, Task, TimelineEntry, User
+
+calls = []
+
+
+@tasks.task
+def flaky(failures):
+    """ Падает первые failures вызовов """
+    calls.append(failures)
+    if len(calls) <= failures:
+        raise RuntimeError('boom')
+
+
+@override_settings(TASK_QUEUE='db', TASK_RETRY_DELAY=0)
+class TestTaskQueueCase(TestCase):
+    def setUp(self):
+        calls.clear()
+        self.author = User.objects.create(username='author')
+        self.reader = User.objects.create(username='reader')
+        Follow.objects.create(user=self.reader, author=self.author)
+        tasks.work(workers=0, once=True)
+
+    def test_write_only_enqueues(self):
+        self.client.force_login(self.author)
+        self.client.post(reverse('new_post'), {'text': 'котики в очереди'})
+        post = Post.objects.get()
+        self.assertTrue(Task.objects.filter(
+            name='posts.timeline.fan_out', args=json.dumps([post.pk])))
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.author.counters.posts, 0)
+
+        self.assertEqual(tasks.work(workers=0, once=True), (3, 0))
+        self.assertFalse(Task.objects.exists())
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+        self.author.counters.refresh_from_db()
+        self.assertEqual(self.author.counters.posts, 1)
+        self.assertEqual(search.search_ids('котики', search.POST, 5),
+                         [post.pk])
+
+    def test_retry(self):
+        flaky.delay(1)
+        # без паузы повтор созревает сразу и выполняется тем же проходом
+        self.assertEqual(tasks.work(workers=0, once=True), (1, 1))
+        self.assertEqual(calls, [1, 1])
+        self.assertFalse(Task.objects.exists())
+
+    @override_settings(TASK_MAX_ATTEMPTS=2)
+    def test_gives_up_after_max_attempts(self):
+        flaky.delay(5)
+        tasks.work(workers=0, once=True)
+        tasks.work(workers=0, once=True)
+        item = Task.objects.get()
+        self.assertEqual(item.status, Task.FAILED)
+        self.assertEqual(item.attempts, 2)
+        self.assertEqual(tasks.work(workers=0, once=True), (0, 0))
+
+    @override_settings(TASK_RETRY_DELAY=60)
+    def test_backoff_postpones_retry(self):
+        flaky.delay(1)
+        self.assertEqual(tasks.work(workers=0, once=True), (0, 1))
+        item = Task.objects.get()
+        self.assertEqual(item.status, Task.QUEUED)
+        self.assertEqual(item.attempts, 1)
+        self.assertIn('boom', item.last_error)
+        self.assertGreater(item.run_after,
+                           timezone.now() + timedelta(seconds=59))
+        self.assertEqual(tasks.work(workers=0, once=True), (0, 0))
+
+    def test_expired_lease_is_reclaimed(self):
+        Task.objects.create(
+            name='posts.tests.tests_tasks.flaky', args='[0]',
+            status=Task.RUNNING, attempts=1,
+            locked_until=timezone.now() - timedelta(seconds=1))
+        Task.objects.create(
+            name='posts.tests.tests_tasks.flaky', args='[0]',
+            status=Task.RUNNING, attempts=1,
+            locked_until=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(tasks.work(workers=0, once=True), (1, 0))
+        self.assertEqual(Task.objects.get().status, Task.RUNNING)
+
+    def test_claim_runs_only_rows_it_updated(self):
+        taken = Task.objects.create(
+            name='posts.tests.tests_tasks.flaky', args='[0]',
+            status=Task.RUNNING, attempts=1,
+            locked_until=timezone.now() + timedelta(minutes=1))
+        free = Task.objects.create(
+            name='posts.tests.tests_tasks.flaky', args='[0]')
+        due = tasks.due
+        # выборка видит и строку, которую уже забрал другой воркер
+        stale = [Task.objects.all()]
+        with patch.object(tasks, 'due',
+                          lambda now: stale.pop() if stale else due(now)):
+            claimed = tasks.claim(10)
+        self.assertEqual(claimed, [free])
+        taken.refresh_from_db()
+        self.assertEqual(taken.attempts, 1)
+
+    def test_worker_survives_claim_error(self):
+        flaky.delay(0)
+        claim = tasks.claim
+        errors = [OperationalError('database is locked')]
+
+        def locked_once(limit):
+            if errors:
+                raise errors.pop()
+            return claim(limit)
+
+        with patch.object(tasks, 'claim', locked_once), \
+                self.assertLogs('posts.tasks', 'ERROR'):
+            self.assertEqual(tasks.work(workers=0, once=True, poll=0),
+                             (1, 0))
+
+    def test_unfollow_before_backfill(self):
+        Post.objects.create(author=self.author, text='старый пост')
+        tasks.work(workers=0, once=True)
+        Follow.objects.filter(user=self.reader).delete()
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.filter(user=self.reader).delete()
+        tasks.work(workers=0, once=True)
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.reader).exists())
+
+    def test_command(self):
+        flaky.delay(0)
+        out = StringIO()
+        call_command('run_tasks', '--once', '--workers', '0', stdout=out)
+        self.assertIn('Выполнено задач: 1', out.getvalue())
+
+
+class TestTaskModesCase(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_sync_runs_immediately(self):
+        flaky.delay(0)
+        self.assertEqual(calls, [0])
+        self.assertFalse(Task.objects.exists())
+
+    @override_settings(TASK_RETRY_DELAY=0)
+    def test_thread_retries(self):
+        tasks.executor().submit(
+            tasks.run_with_retries, 'posts.tests.tests_tasks.flaky',
+            [2]).result()
+        self.assertEqual(calls, [2, 2, 2])
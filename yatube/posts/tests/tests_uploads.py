@@ -0,0 +1,69 @@
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.shortcuts import reverse
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from posts.models import Post, User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def jpeg_with_exif(size=(64, 48), color='red'):
+    image = Image.new('RGB', size, color)
+    exif = Image.Exif()
+    exif[0x010f] = 'SpyCam'  # Make
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', exif=exif.tobytes())
+    return SimpleUploadedFile('photo.jpg', buffer.getvalue(),
+                              content_type='image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, TASK_QUEUE='sync',
+                   POST_IMAGE_RENDITIONS={})
+class TestImageUpload(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = User.objects.create(username='muzzy')
+        self.client.force_login(self.user)
+
+    def upload(self, image, text='text'):
+        return self.client.post(reverse('new_post'),
+                                {'text': text, 'image': image})
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_SIZE=100)
+    def test_too_large_file_rejected(self):
+        response = self.upload(jpeg_with_exif())
+        self.assertIn('image', response.context['form'].errors)
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=1000)
+    def test_too_large_dimensions_rejected(self):
+        response = self.upload(jpeg_with_exif())
+        self.assertIn('Слишком большая картинка',
+                      response.context['form'].errors['image'][0])
+
+    @override_settings(POST_IMAGE_MAX_SIDE=32)
+    def test_oversized_image_downscaled(self):
+        self.upload(jpeg_with_exif(color='green'))
+        with Image.open(Post.objects.get().image.path) as image:
+            self.assertEqual(image.size, (32, 24))
+
+    def test_exif_stripped(self):
+        self.upload(jpeg_with_exif(color='blue'))
+        with Image.open(Post.objects.get().image.path) as image:
+            self.assertEqual(dict(image.getexif()), {})
+
+    def test_identical_uploads_deduplicated(self):
+        self.upload(jpeg_with_exif(), text='first')
+        self.upload(jpeg_with_exif(), text='second')
+        first, second = Post.objects.order_by('pk')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.startswith('posts/'))
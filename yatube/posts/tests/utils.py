@@ -0,0 +1,78 @@
+import re
+from collections import Counter
+
+from django.core.signals import request_started
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# литералы в SQL: строки и числа (id, даты, LIMIT)
+SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def query_shape(sql):
+    """ Вид запроса без конкретных значений """
+    return SQL_LITERALS.sub('?', sql)
+
+
+class QueryCountMixin:
+    """
+    Проверка страниц на N+1: страница запрашивается при N = 1, 10, 100
+    объектах, и ни один вид запроса не должен выполняться чаще, чем
+    при N = 1. Новый вид, выполненный один раз, допустим: например,
+    число страниц считается, только когда их больше одной.
+    При нарушении тест падает со списком запросов
+    """
+    sizes = (1, 10, 100)
+
+    def capture_queries(self, path, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, data or {})
+        self.assertEqual(response.status_code, 200, path)
+        return [query['sql'] for query in queries.captured_queries]
+
+    def assertQueriesConstant(self, path, grow, data=None):
+        """
+        :param grow: функция n -> None, доводит данные до n объектов
+        """
+        first = None
+        for size in self.sizes:
+            grow(size)
+            queries = self.capture_queries(path, data)
+            shapes = Counter(query_shape(sql) for sql in queries)
+            if first is None:
+                first = shapes
+                continue
+            repeated = [shape for shape, count in shapes.items()
+                        if count > max(first[shape], 1)]
+            if repeated:
+                self.fail(
+                    f'{path}: {sum(first.values())} запросов при '
+                    f'N={self.sizes[0]}, {len(queries)} при N={size}, '
+                    f'повторяются:\n' + '\n'.join(repeated) +
+                    '\n\nВсе запросы:\n' + '\n'.join(queries))
+
+
+def run_commit_callbacks(**kwargs):
+    """ Выполняет отложенные transaction.on_commit, как при коммите """
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for _, callback in callbacks:
+        callback()
+
+
+class CommitCallbacksMixin:
+    """
+    TestCase не коммитит транзакцию, и on_commit-колбэки (сброс версий
+    кеша) не выполняются. Здесь они выполняются перед каждым запросом
+    тестового клиента: как в жизни, где запрос приходит после коммита
+    прошлой записи
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        request_started.connect(run_commit_callbacks)
+
+    @classmethod
+    def tearDownClass(cls):
+        request_started.disconnect(run_commit_callbacks)
+        super().tearDownClass()
@@ -0,0 +1,223 @@
+"""
+Лента подписок с раскладкой при записи (fan-out-on-write).
+
+Новый пост сразу попадает в TimelineEntry каждого подписчика автора,
+и /follow/ листает уже готовую ограниченную ленту по ключу
+(pub_date, post_id) индекса (user, pub_date, post) вместо JOIN всех
+подписок и сортировки, а сами посты достает по id.
+Посты «звезд» не раскладываются — их подмешиваем при чтении
+(fan-out-on-read): по выборке с LIMIT на каждую «звезду» по индексу
+(author, pub_date, id). «Звездой» автор становится, когда при раскладке
+подписчиков оказалось больше TIMELINE_FANOUT_LIMIT, и остается ею
+навсегда (UserCounters.fan_out_on_read): запись и чтение решают по
+одному флагу, и пропущенные при раскладке посты не теряются, даже если
+подписчиков потом станет меньше.
+Раскладка идет фоновыми задачами (posts/tasks.py), поэтому каждая
+заново проверяет подписку и сама сбрасывает кеш затронутых лент.
+"""
+import heapq
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils.functional import cached_property
+
+from posts.cache import bump
+from posts.models import Follow, Post, TimelineEntry, UserCounters
+from posts.paginator import CursorPaginator
+from posts.tasks import task
+
+
+def followers_for_fan_out(author_id):
+    """
+    Подписчики автора или None, если автор — «звезда». Автор, у которого
+    подписчиков больше лимита, помечается «звездой» навсегда
+    """
+    if UserCounters.objects.filter(
+            user_id=author_id, fan_out_on_read=True).exists():
+        return None
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    followers = list(Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)[:limit + 1])
+    if len(followers) > limit:
+        UserCounters.objects.filter(user_id=author_id).update(
+            fan_out_on_read=True)
+        return None
+    return followers
+
+
+def celebrities_followed_by(user):
+    """ Авторы-«звезды» из подписок пользователя """
+    return Follow.objects.filter(
+        user=user, author__counters__fan_out_on_read=True,
+    ).values('author_id')
+
+
+def trim(user_ids):
+    """ Оставляет в лентах пользователей не больше TIMELINE_LENGTH постов """
+    oldest_kept = TimelineEntry.objects.filter(
+        user=OuterRef('user'),
+    ).order_by('-pub_date').values('pub_date')[
+        settings.TIMELINE_LENGTH - 1:settings.TIMELINE_LENGTH]
+    TimelineEntry.objects.filter(
+        user__in=user_ids,
+        pub_date__lt=Subquery(oldest_kept),
+    ).delete()
+
+
+def follower_scopes(user_ids):
+    return [f'follower:{user_id}' for user_id in user_ids]
+
+
+def following(user_id, author_id):
+    return Follow.objects.filter(user_id=user_id, author_id=author_id).exists()
+
+
+@task
+def fan_out(post_id):
+    """ Раскладывает новый пост по лентам подписчиков автора """
+    post = Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'pub_date').first()
+    if post is None:
+        return
+    author_id, pub_date = post
+    followers = followers_for_fan_out(author_id)
+    if not followers:
+        return
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for user_id in followers),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    trim(followers)
+    bump(*follower_scopes(followers))
+
+
+@task
+def backfill(user_id, author_id):
+    """ После подписки добавляет в ленту последние посты автора """
+    if (not following(user_id, author_id)
+            or followers_for_fan_out(author_id) is None):
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date').values_list('pk', 'pub_date')[:settings.TIMELINE_LENGTH]
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    trim([user_id])
+    bump(*follower_scopes([user_id]))
+
+
+@task
+def drop(user_id, author_id):
+    """ После отписки убирает посты автора из ленты """
+    if following(user_id, author_id):
+        return
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+    bump(*follower_scopes([user_id]))
+
+
+# авторы, у которых подписчиков больше лимита, становятся «звездами»
+MARK_SQL = '''
+    UPDATE {counters} SET fan_out_on_read = %s
+    WHERE user_id IN (SELECT author_id FROM {follows}
+                      GROUP BY author_id HAVING COUNT(*) > %s)
+'''
+# последние TIMELINE_LENGTH постов каждого автора, не «звезды», по лентам
+# его подписчиков, и у каждого подписчика тоже не больше TIMELINE_LENGTH
+REBUILD_SQL = '''
+    INSERT INTO {entries} (user_id, post_id, pub_date)
+    SELECT user_id, post_id, pub_date FROM (
+        SELECT f.user_id, p.post_id, p.pub_date,
+               ROW_NUMBER() OVER (PARTITION BY f.user_id
+                                  ORDER BY p.pub_date DESC, p.post_id DESC
+                                  ) AS position
+        FROM {follows} f
+        JOIN (SELECT id AS post_id, author_id, pub_date,
+                     ROW_NUMBER() OVER (PARTITION BY author_id
+                                        ORDER BY pub_date DESC, id DESC
+                                        ) AS position
+              FROM {posts}) p
+          ON p.author_id = f.author_id AND p.position <= %s
+        WHERE f.author_id NOT IN (
+            SELECT user_id FROM {counters} WHERE fan_out_on_read = %s)
+    ) ranked
+    WHERE position <= %s
+'''
+
+
+def rebuild():
+    """
+    Собирает все ленты заново одним INSERT ... SELECT: после загрузки
+    данных без сигналов и для подписок, появившихся до TimelineEntry
+    """
+    tables = {'entries': TimelineEntry._meta.db_table,
+              'follows': Follow._meta.db_table,
+              'posts': Post._meta.db_table,
+              'counters': UserCounters._meta.db_table}
+    length = settings.TIMELINE_LENGTH
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(MARK_SQL.format(**tables),
+                       [True, settings.TIMELINE_FANOUT_LIMIT])
+        cursor.execute(f'DELETE FROM {TimelineEntry._meta.db_table}')
+        cursor.execute(REBUILD_SQL.format(**tables), [length, True, length])
+    # ленты /follow/ зависят от scope posts: сбрасываем их все разом
+    bump('posts')
+    return TimelineEntry.objects.count()
+
+
+class TimelinePaginator(CursorPaginator):
+    """
+    Лента /follow/: курсор по (pub_date, post_id) в TimelineEntry
+    пользователя, слитый с постами «звезд» из его подписок
+    """
+
+    def __init__(self, user, per_page):
+        super().__init__(TimelineEntry.objects.filter(user=user), per_page,
+                         key_field='post_id')
+        self.user = user
+
+    @cached_property
+    def count(self):
+        return None
+
+    @cached_property
+    def celebrities(self):
+        return list(celebrities_followed_by(self.user).values_list(
+            'author_id', flat=True))
+
+    def keys(self, cursor, newer, limit):
+        """ Ключи (дата, id поста) от курсора, ближние первыми """
+        sources = [self.from_cursor(self.object_list, cursor, newer)
+                   .values_list('pub_date', 'post_id')[:limit]]
+        for author_id in self.celebrities:
+            posts = Post.objects.filter(author_id=author_id).order_by(
+                '-pub_date', '-pk')
+            sources.append(self.from_cursor(posts, cursor, newer, 'pk')
+                           .values_list('pub_date', 'pk')[:limit])
+        if len(sources) == 1:
+            return list(sources[0])
+        keys = []
+        # пост «звезды», разложенный до того, как она ею стала, есть
+        # в обоих источниках: одинаковые ключи идут подряд
+        for key in heapq.merge(*sources, reverse=not newer):
+            if not keys or keys[-1] != key:
+                keys.append(key)
+            if len(keys) == limit:
+                break
+        return keys
+
+    def fetch(self, cursor, newer, start, stop):
+        ids = [post_id for _, post_id in self.keys(
+            cursor, newer, stop)[start:stop]]
+        posts = Post.objects.feed().in_bulk(ids)
+        objects = [posts[post_id] for post_id in ids if post_id in posts]
+        return objects[::-1] if newer else objects
+
+    def found(self, cursor, newer, limit):
+        return len(self.keys(cursor, newer, limit))
@@ -0,0 +1,125 @@
+"""
+Прием картинок постов.
+
+ImageUploadHandler проверяет загрузку прямо во время чтения запроса:
+считает размер и sha256, по первым байтам узнает размеры картинки и,
+если лимиты превышены, перестает писать файл на диск. Форма
+(PostForm, см. PostImageField) показывает ошибку, а подходящую
+картинку process_image уменьшает до POST_IMAGE_MAX_SIDE и сохраняет
+без метаданных. Одинаковые загрузки (по хешу) хранятся один раз.
+"""
+import hashlib
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageFile, ImageOps
+
+UPLOAD_TO = 'posts/'
+# в чем сохранять обработанный оригинал: PNG (прозрачность) остается PNG
+SAVE_FORMATS = {
+    'PNG': ('PNG', 'png', {'optimize': True}),
+    'WEBP': ('WEBP', 'webp', {'quality': 90}),
+}
+DEFAULT_FORMAT = ('JPEG', 'jpg', {'quality': 90, 'optimize': True})
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Пишет загрузку во временный файл, по дороге считая sha256 и проверяя
+    лимиты POST_IMAGE_MAX_UPLOAD_SIZE и POST_IMAGE_MAX_PIXELS.
+    Результат проверки кладется в атрибуты файла content_sha256
+    и upload_error
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.received = 0
+        self.parser = ImageFile.Parser()
+        self.error = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.error:
+            return None
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+            limit = filesizeformat(settings.POST_IMAGE_MAX_UPLOAD_SIZE)
+            self.error = f'Файл больше {limit}'
+            return None
+        self.sha256.update(raw_data)
+        self.check_dimensions(raw_data)
+        if self.error:
+            return None
+        return super().receive_data_chunk(raw_data, start)
+
+    def check_dimensions(self, raw_data):
+        """ Размер картинки известен из заголовка, не дожидаясь конца файла """
+        if self.parser is None:
+            return
+        try:
+            self.parser.feed(raw_data)
+        except Exception:
+            # не картинка: это скажет валидация ImageField
+            self.parser = None
+            return
+        if self.parser.image is None:
+            return
+        width, height = self.parser.image.size
+        self.parser = None
+        if width * height > settings.POST_IMAGE_MAX_PIXELS:
+            self.error = f'Слишком большая картинка: {width}x{height}'
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        uploaded.content_sha256 = self.sha256.hexdigest()
+        uploaded.upload_error = self.error
+        return uploaded
+
+
+def content_sha256(uploaded):
+    """ Хеш загрузки: из обработчика или, если его не было, по чанкам """
+    digest = getattr(uploaded, 'content_sha256', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    uploaded.seek(0)
+    for chunk in uploaded.chunks():
+        sha256.update(chunk)
+    uploaded.seek(0)
+    return sha256.hexdigest()
+
+
+def process_image(uploaded):
+    """
+    Уменьшает картинку до POST_IMAGE_MAX_SIDE по большей стороне,
+    поворачивает по EXIF и сохраняет без метаданных.
+
+    Возвращает имя уже сохраненного файла с тем же содержимым
+    (дубликат) или ContentFile для сохранения в Post.image
+    """
+    digest = content_sha256(uploaded)[:32]
+    uploaded.seek(0)
+    image = Image.open(uploaded)
+    pil_format, extension, options = SAVE_FORMATS.get(
+        image.format, DEFAULT_FORMAT)
+    name = f'{digest}.{extension}'
+    if default_storage.exists(UPLOAD_TO + name):
+        return UPLOAD_TO + name
+
+    image = ImageOps.exif_transpose(image)
+    max_side = settings.POST_IMAGE_MAX_SIDE
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    icc_profile = image.info.get('icc_profile')
+    if icc_profile:
+        # цветовой профиль оставляем, остальные метаданные (EXIF с
+        # геометкой и т.п.) Pillow без явной передачи не сохраняет
+        options = dict(options, icc_profile=icc_profile)
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    return ContentFile(buffer.getvalue(), name=name)
@@ -7,14 +7,19 @@ urlpatterns = [
     path('new/', views.new_post, name='new_post'),
     path('group/<slug:slug>/', views.group_posts, name='group_posts'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('search/', views.search_posts, name='search'),
     path('<str:username>/', views.profile, name='profile'),
     path('<str:username>/<int:post_id>/', views.post_detail, name='post_view'),
     path('<str:username>/<int:post_id>/edit/',
          views.post_edit, name='post_edit'),
     path('<str:username>/<int:post_id>/comment/',
          views.add_comment, name='add_comment'),
+    path('<str:username>/<int:post_id>/comments/',
+         views.post_comments, name='post_comments'),
     path('<str:username>/follow/',
          views.profile_follow, name='profile_follow'),
     path('<str:username>/unfollow/',
          views.profile_unfollow, name='profile_unfollow'),
+    path('<str:username>/switch/',
+         views.profile_follow_switch, name='profile_follow_switch'),
 ]
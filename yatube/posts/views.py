@@ -1,20 +1,47 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 
+from posts import renditions, search
+from posts.cache import cache_feed, revalidate_page
 from posts.forms import CommentForm, PostForm
-from posts.models import Group, Post, User
+from posts.models import Comment, Follow, Group, Post, User
+from posts.paginator import CursorPaginator, to_int
+from posts.timeline import TimelinePaginator
 
 
-def get_paginator_context(posts_list, page_slice, request) -> dict:
-    paginator = Paginator(posts_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+def get_paginator_context(posts_list, page_slice, request,
+                          count_key=None) -> dict:
+    paginator = CursorPaginator(posts_list, page_slice, count_key=count_key)
+    return paginate(paginator, request)
+
+
+def paginate(paginator, request) -> dict:
+    page = paginator.get_page(
+        before=request.GET.get('before'),
+        after=request.GET.get('after'),
+        skip=request.GET.get('skip'),
+        number=request.GET.get('page'),
+    )
     context = {'page': page, 'paginator': paginator}
     return context
 
 
+def get_comments_page(post, request):
+    """ Страница комментариев поста: курсор по (created, id) """
+    comments = post.comments.select_related('author')
+    paginator = CursorPaginator(comments, 20, date_field='created')
+    return paginator.get_page(before=request.GET.get('before'))
+
+
+def author_scopes(request, username, **kwargs):
+    """
+    Профиль и страница поста зависят от постов, комментариев
+    и подписок автора и от названий групп
+    """
+    return [f'author:{username}', 'groups']
+
+
 def page_not_found(request, exception):
     return render(request, "misc/404.html",
                   {"path": request.path}, status=404)
@@ -24,48 +51,87 @@ def server_error(request):
     return render(request, "misc/500.html", status=500)
 
 
-@cache_page(20 * 60)
+@revalidate_page(lambda request: ['posts'])
+@cache_feed(lambda request: ['posts'])
 def index(request):
-    posts_list = Post.objects.all()
-    context = get_paginator_context(posts_list, 10, request)
+    posts_list = Post.objects.feed()
+    context = get_paginator_context(posts_list, 10, request,
+                                    count_key='index')
     return render(request, 'index.html', context)
 
 
+@revalidate_page(lambda request, slug: [f'group:{slug}'])
+@cache_feed(lambda request, slug: [f'group:{slug}'])
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts_list = group.posts.all()
+    posts_list = group.posts.feed()
     context = {'group': group}
-    context.update(get_paginator_context(posts_list, 10, request))
+    context.update(get_paginator_context(posts_list, 10, request,
+                                         count_key=f'group:{group.pk}'))
     return render(request, 'group.html', context)
 
 
+@revalidate_page(author_scopes)
+@cache_feed(author_scopes)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts_list = author.posts.all()
+    author = get_object_or_404(User.objects.select_related('counters'),
+                               username=username)
+    posts_list = author.posts.feed()
 
-    context = {
-        'author': author,
-        'is_follow': author.following.contains(request.user),
-    }
+    context = {'author': author}
     context.update(get_paginator_context(posts_list, 10, request))
     return render(request, 'profile.html', context)
 
 
+def search_posts(request):
+    """
+    Поиск по постам и комментариям. Страницы по OFFSET, поэтому
+    их число ограничено SEARCH_MAX_PAGES
+    """
+    query = request.GET.get('q', '').strip()
+    per_page = 10
+    number = min(to_int(request.GET.get('page'), 1),
+                 settings.SEARCH_MAX_PAGES)
+    post_ids = search.search_ids(query, search.POST, per_page + 1,
+                                 offset=(number - 1) * per_page)
+    comment_ids = search.search_ids(query, search.COMMENT, per_page)
+    context = {
+        'query': query,
+        'number': number,
+        'has_next': (len(post_ids) > per_page
+                     and number < settings.SEARCH_MAX_PAGES),
+        'posts': search.ranked(Post.objects.feed(), post_ids[:per_page]),
+        'comments': search.ranked(
+            Comment.objects.select_related('author', 'post__author'),
+            comment_ids),
+    }
+    return render(request, 'search.html', context)
+
+
+@revalidate_page(author_scopes)
+@cache_feed(author_scopes)
 def post_detail(request, username, post_id):
-    author = get_object_or_404(User, username=username)
-    post = get_object_or_404(author.posts, pk=post_id)
+    author = get_object_or_404(User.objects.select_related('counters'),
+                               username=username)
+    post = get_object_or_404(author.posts.feed(), pk=post_id)
     form = CommentForm()
-    is_follow = author.following.contains(request.user)
 
     context = {
         'author': author,
         'post': post,
         'form': form,
-        'is_follow': is_follow,
+        'comments': get_comments_page(post, request),
     }
     return render(request, 'post.html', context)
 
 
+def post_comments(request, username, post_id):
+    """ Следующая страница комментариев HTML-фрагментом для подгрузки """
+    post = get_object_or_404(Post, author__username=username, pk=post_id)
+    context = {'post': post, 'comments': get_comments_page(post, request)}
+    return render(request, 'comment_list.html', context)
+
+
 @login_required
 def post_edit(request, username, post_id):
     author = get_object_or_404(User, username=username)
@@ -80,6 +146,8 @@ def post_edit(request, username, post_id):
     if request.method == 'POST':
         if form.is_valid():
             form.save()
+            if 'image' in form.changed_data:
+                renditions.schedule(post)
             return redirect('post_view', username, post.id)
 
     context = {'form': form, 'post': post}
@@ -95,6 +163,8 @@ def new_post(request):
             post = form.save(commit=False)
             post.author = request.user
             post.save()
+            if post.image:
+                renditions.schedule(post)
             return redirect('index')
         return render(request, 'new_post.html', {'form': form})
 
@@ -119,29 +189,29 @@ def add_comment(request, username, post_id):
 
 
 @login_required
+@cache_feed(lambda request: ['posts', f'follower:{request.user.pk}'],
+            per_user=True)
 def follow_index(request):
-    posts_list = request.user.follower.posts()
-    context = get_paginator_context(posts_list, 10, request)
+    context = paginate(TimelinePaginator(request.user, 10), request)
     return render(request, 'follow.html', context)
 
 
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
-    author.following.append(request.user)
+    Follow.objects.follow(request.user, author)
     return redirect('profile', username)
 
 
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    request.user.follower.remove(author)
+    Follow.objects.unfollow(request.user, author)
     return redirect('profile', username)
 
 
 @login_required
 def profile_follow_switch(request, username):
-    # Из-за тестов отложу функцию до лучших времен. Она заменит две выше
     author = get_object_or_404(User, username=username)
-    author.following.switch(request.user)
+    Follow.objects.toggle(request.user, author)
     return redirect('profile', username)
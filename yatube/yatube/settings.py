@@ -29,6 +29,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'posts.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -104,18 +105,116 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 SITE_ID = 1
 
 
-if DEBUG:
-    CACHES = {
-        'default': {
-            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
-        },
-        'other': {
-            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        }
-    }
-else:
-    CACHES = {
-        'default': {
-            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        }
-    }
+# Кеш должен быть общим для всех процессов (воркеров gunicorn): иначе
+# у каждого свой холодный кеш, а версии, которые сбрасывают сигналы,
+# до других воркеров не доходят. Бэкенд выбирается окружением:
+# YATUBE_CACHE = dummy (без кеша, по умолчанию при DEBUG), locmem (память
+# процесса), file (каталог YATUBE_CACHE_LOCATION, по умолчанию без
+# DEBUG) или memcached (host:port в YATUBE_CACHE_LOCATION). Файлы видны
+# всем процессам одной машины, но add и incr в них не атомарны, и
+# блокировка от «толпы» между процессами лишь сужает окно гонки;
+# для нескольких воркеров лучше memcached. YATUBE_CACHE_VERSION устаревает
+# весь кеш, например после выкладки с новыми шаблонами
+CACHE_BACKENDS = {
+    'dummy': 'django.core.cache.backends.dummy.DummyCache',
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'memcached': 'django.core.cache.backends.memcached.MemcachedCache',
+}
+CACHE_LOCATIONS = {
+    'locmem': 'yatube',
+    'file': os.path.join(BASE_DIR, '.cache'),
+    'memcached': '127.0.0.1:11211',
+}
+# MAX_ENTRIES понимают только locmem и file: memcached передает OPTIONS
+# аргументами в memcache.Client
+CACHE_OPTIONS = {
+    'locmem': {'MAX_ENTRIES': 10000},
+    'file': {'MAX_ENTRIES': 10000},
+}
+CACHE_BACKEND = os.environ.get('YATUBE_CACHE', 'dummy' if DEBUG else 'file')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.environ.get('YATUBE_CACHE_LOCATION',
+                                   CACHE_LOCATIONS.get(CACHE_BACKEND, '')),
+        'KEY_PREFIX': 'yatube',
+        'VERSION': int(os.environ.get('YATUBE_CACHE_VERSION', 1)),
+        # длинные ключи (с полным адресом страницы) сжимаются в хеш
+        'KEY_FUNCTION': 'posts.cache.make_key',
+        'OPTIONS': CACHE_OPTIONS.get(CACHE_BACKEND, {}),
+    },
+}
+
+# Ленты инвалидируются сигналами (posts/signals.py), поэтому живут долго
+FEED_CACHE_TIMEOUT = 24 * 60 * 60
+# Защита от «толпы» при промахе: страницу рендерит один процесс под
+# блокировкой, остальные отдают предыдущую версию или ждут до
+# FEED_CACHE_LOCK_WAIT секунд
+FEED_CACHE_LOCK_TIMEOUT = 10
+FEED_CACHE_LOCK_WAIT = 2
+# Досрочный пересчет до истечения срока (posts.cache.expiring): больше
+# 1 — раньше, 0 — только по истечении
+CACHE_EARLY_RECOMPUTE_BETA = 1.0
+# Счетчики попаданий копятся в процессе и сбрасываются в общий кеш
+# раз в столько событий (manage.py cache_stats)
+CACHE_STATS_FLUSH_EVERY = 100
+
+# Материализованная лента подписок (posts/timeline.py): сколько постов
+# хранить у каждого читателя и с какого числа подписчиков автор считается
+# «звездой», чьи посты не раскладываются по лентам, а читаются при запросе
+TIMELINE_LENGTH = 1000
+TIMELINE_FANOUT_LIMIT = 5000
+
+# Полнотекстовый поиск (posts/search.py): выдача листается по OFFSET,
+# поэтому глубина ограничена, дальше стоит уточнять запрос
+SEARCH_MAX_PAGES = 20
+
+# Фоновые задачи после записи (posts/tasks.py): sync — сразу в запросе
+# (тесты и локальная разработка), thread — пул потоков процесса после
+# коммита, db — таблица Task, ее разбирает manage.py run_tasks.
+# Упавшая задача повторяется с паузой TASK_RETRY_DELAY секунд,
+# удваивающейся до TASK_RETRY_MAX_DELAY; TASK_LEASE — сколько секунд
+# задача числится за воркером, прежде чем ее заберет другой
+TASK_QUEUE = os.environ.get('YATUBE_TASKS', 'sync' if DEBUG else 'thread')
+TASK_WORKERS = 4
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_DELAY = 2
+TASK_RETRY_MAX_DELAY = 5 * 60
+TASK_LEASE = 10 * 60
+
+# Метрики запросов (posts/metrics.py): бюджет SQL-запросов на запрос
+# (по умолчанию и по имени view), сводка в лог раз в столько запросов
+# и заголовок Server-Timing с временем базы и шаблонов
+QUERY_BUDGET = 15
+QUERY_BUDGETS = {
+    'index': 10,
+    'group_posts': 10,
+    'profile': 10,
+    'post_view': 10,
+    'follow_index': 10,
+}
+REQUEST_METRICS_LOG_EVERY = 1000
+REQUEST_METRICS_SERVER_TIMING = DEBUG
+
+# Копии картинок постов готовятся заранее фоновой задачей
+# (posts/renditions.py)
+# size — итоговые пропорции (картинка обрезается по центру), widths —
+# ширины для srcset, sizes — подсказка браузеру для выбора ширины
+POST_IMAGE_RENDITIONS = {
+    'card': {
+        'size': (960, 339),
+        'widths': [320, 640, 960],
+        'sizes': '(max-width: 992px) 100vw, 960px',
+    },
+}
+# современные форматы в порядке предпочтения; неподдерживаемые Pillow
+# пропускаются, копия в формате оригинала делается всегда
+POST_IMAGE_FORMATS = ['avif', 'webp']
+
+# Прием картинок постов (posts/uploads.py): лимиты проверяются во время
+# загрузки, оригинал уменьшается до POST_IMAGE_MAX_SIDE по большей стороне
+FILE_UPLOAD_HANDLERS = ['posts.uploads.ImageUploadHandler']
+POST_IMAGE_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+POST_IMAGE_MAX_SIDE = 2560